@@ -1,56 +1,88 @@
+from abc import ABC, abstractmethod
+import atexit
+import os
+from array import array
+from bisect import bisect_right
 from dataclasses import dataclass, field
-from struct import pack
-from typing import ClassVar, Optional, TextIO
+from itertools import chain
+from operator import attrgetter
+from struct import Struct, error, pack
+from typing import ClassVar, Iterable, Optional
 
-_TEXT_RENDERING = {
+# Events are accumulated in memory and written to /dev/canvas all at once.
+# The buffer is flushed on commit, on remove, at exit, or once it grows past this many bytes.
+_FLUSH_THRESHOLD = 1 << 16
+
+# Events whose effect is unchanged when immediately repeated with the same payload:
+# begin_path, close_path, set_transform and reset_transform.
+_IDEMPOTENT_EVENTS = frozenset((32, 33, 50, 51))
+
+# State setters are held back until an event that depends on them, so only the last value
+# of each property set between two draws is sent
+_STATE_EVENTS = frozenset((*range(10, 32), 52, 53, 54, 57, 58))
+
+# Path building and transforms do not depend on the state setters, so they do not release them
+_PATH_EVENTS = frozenset((*range(32, 43), *range(46, 52)))
+
+# Polyline and FillRects events carry their point and rectangle counts as a uint16
+_MAX_POLYLINE_POINTS = 0xFFFF
+_MAX_FILL_RECTS = 0xFFFF
+
+
+def _enum_table(enum: dict[str, int]) -> dict[str, bytes]:
+    """Prepacks the values of an enum so that setters can dispatch them directly"""
+    return {name: value.to_bytes(1) for name, value in enum.items()}
+
+
+_TEXT_RENDERING = _enum_table({
     "auto": 0,
     "optimizeSpeed": 1,
     "optimizeLegibility": 2,
     "geometricPrecision": 3
-}
+})
 
-_LINE_CAP = {
+_LINE_CAP = _enum_table({
     "butt": 0,
     "round": 1,
     "square": 2
-}
+})
 
-_LINE_JOIN = {
+_LINE_JOIN = _enum_table({
     "miter": 0,
     "bevel": 1,
     "round": 2
-}
+})
 
-_TEXT_ALIGN = {
+_TEXT_ALIGN = _enum_table({
     "start": 0,
     "end": 1,
     "left": 2,
     "right": 3,
     "center": 4
-}
+})
 
-_TEXT_BASELINE = {
+_TEXT_BASELINE = _enum_table({
     "alphabetic": 0,
     "hanging": 1,
     "top": 2,
     "middle": 3,
     "bottom": 4,
     "ideographic": 5
-}
+})
 
-_DIRECTION = {
+_DIRECTION = _enum_table({
     "inherit": 0,
     "ltr": 1,
     "rtl": 2
-}
+})
 
-_FONT_KERNING = {
+_FONT_KERNING = _enum_table({
     "auto": 0,
     "normal": 1,
     "none": 2
-}
+})
 
-_FONT_STRETCH = {
+_FONT_STRETCH = _enum_table({
     "normal": 0,
     "ultra-condensed": 1,
     "extra-condensed": 2,
@@ -60,9 +92,9 @@ _FONT_STRETCH = {
     "expanded": 6,
     "extra-expanded": 7,
     "ultra-expanded": 8
-}
+})
 
-_FONT_VARIANT_CAPS = {
+_FONT_VARIANT_CAPS = _enum_table({
     "normal": 0,
     "small-caps": 1,
     "all-small-caps": 2,
@@ -70,14 +102,14 @@ _FONT_VARIANT_CAPS = {
     "all-petite-caps": 4,
     "unicase": 5,
     "titling-caps": 6
-}
+})
 
-_FILL_RULE = {
+_FILL_RULE = _enum_table({
     "nonzero": 0,
     "evenodd": 1
-}
+})
 
-_GLOBAL_COMPOSITE_OPERATION = {
+_GLOBAL_COMPOSITE_OPERATION = _enum_table({
     "source-over": 0,
     "source-in": 1,
     "source-out": 2,
@@ -104,72 +136,121 @@ _GLOBAL_COMPOSITE_OPERATION = {
     "saturation": 23,
     "color": 24,
     "luminosity": 25
-}
+})
 
-_IMAGE_SMOOTHING_QUALITY = {
+_IMAGE_SMOOTHING_QUALITY = _enum_table({
     "low": 0,
     "medium": 1,
     "high": 2
-}
+})
+
+
+# Precompiled packers for fixed-shape payloads
+_HEADER = Struct(">IBB")            # [length: uint32] [event_type: uint8] [id: uint8]
+_F32 = Struct(">f")
+_I16 = Struct(">h")
+_POINT = Struct(">hh")
+_RECT = Struct(">hhhh")
+_ARC_TO = Struct(">hhhhh")
+_BEZIER = Struct(">hhhhhh")
+_ARC = Struct(">hhhff?")
+_ELLIPSE = Struct(">hhhhfff?")
+_CONIC = Struct(">hhf")
+_VECTOR = Struct(">ff")
+_MATRIX = Struct(">ffffff")
+
+# Header and payload fused into one packer for the hottest events
+_POINT_EVENT = Struct(">IBBhh")
+_RECT_EVENT = Struct(">IBBhhhh")
 
 
 def _str(string: str) -> bytes:
-    return len(string).to_bytes(4) + string.encode()
+    # The length prefix counts UTF-8 bytes, not characters
+    data = string.encode()
+    return len(data).to_bytes(4) + data
 
 
-def _f32(value: float) -> bytes:
-    return pack(">f", value)
+_f32 = _F32.pack
 
 
 def _i16(value: int | float) -> bytes:
-    return round(value).to_bytes(2, signed=True)
+    # round() on an int still goes through a method call, so ints skip it
+    return _I16.pack(value if value.__class__ is int else round(value))
 
 
-def _enum(value: str, enum: dict[str, int]) -> bytes:
-    if value not in enum:
-        raise ValueError(f"Invalid value: {value}. Valid values: {', '.join(enum.keys())}")
-    return enum[value].to_bytes(1)
+def _point(x: float, y: float) -> tuple[int, int]:
+    # Path points are packed later, so they are range checked here to fail at the call that made them
+    x, y = round(x), round(y)
+    if not (-0x8000 <= x <= 0x7FFF and -0x8000 <= y <= 0x7FFF):
+        raise error("path coordinates must be in the int16 range -32768 to 32767")
+    return x, y
+
+
+def _enum(value: str, enum: dict[str, bytes]) -> bytes:
+    try:
+        return enum[value]
+    except KeyError:
+        raise ValueError(f"Invalid value: {value}. Valid values: {', '.join(enum.keys())}") from None
 
 
 def _bool(value: bool) -> bytes:
     return b"\x01" if value else b"\x00"
 
 
-@dataclass
-class CanvasGradient:
-    __stops: list[tuple[float, str]]
+@dataclass(slots=True)
+class CanvasGradient(ABC):
+    # Stop offsets and their colors, which are serialized as they are added
+    __offsets: array = field(default_factory=lambda: array("f"), init=False)
+    __colors: list[bytes] = field(default_factory=list, init=False)
+    # Serialized form of the gradient, reset whenever a stop is added
+    __packed: Optional[bytes] = field(default=None, init=False, repr=False, compare=False)
 
     def add_color_stop(self, offset: float, color: str):
         if offset < 0 or offset > 1:
             raise ValueError(f"Invalid offset: {offset}. Offset must be between 0 and 1")
-        self.__stops.append((offset, color))
+        if len(self.__offsets) == 255:
+            raise ValueError("Too many color stops! A gradient can only have 255 color stops")
+        # Keep stops sorted by offset, with equal offsets in the order they were added.
+        # The offset is rounded to float32 first so that it compares equal to stored copies of itself.
+        offset = _F32.unpack(_f32(offset))[0]
+        i = bisect_right(self.__offsets, offset)
+        self.__offsets.insert(i, offset)
+        self.__colors.insert(i, _str(color))
+        self.__packed = None
 
     def _pack(self) -> bytes:
-        return pack("B", len(self.__stops)) + b"".join(_f32(offset) + _str(color) for offset, color in self.__stops)
+        if self.__packed is None:
+            stops = chain.from_iterable(zip(map(_f32, self.__offsets), self.__colors))
+            self.__packed = b"".join((len(self.__offsets).to_bytes(1), *stops, self._pack_shape()))
+        return self.__packed
+
+    @abstractmethod
+    def _pack_shape(self) -> bytes:
+        pass
 
 
-@dataclass
+@dataclass(slots=True)
 class _LinearGradient(CanvasGradient):
     _x0: float
     _y0: float
     _x1: float
     _y1: float
 
-    def _pack(self) -> bytes:
-        return super()._pack() + b"\x00" + _i16(self._x0) + _i16(self._y0) + _i16(self._x1) + _i16(self._y1)
+    def _pack_shape(self) -> bytes:
+        return b"\x00" + _RECT.pack(round(self._x0), round(self._y0), round(self._x1), round(self._y1))
 
 
-@dataclass
+@dataclass(slots=True)
 class _ConicGradient(CanvasGradient):
     _x: float
     _y: float
     _angle: float
 
-    def _pack(self) -> bytes:
-        return super()._pack() + b"\x01" + _i16(self._x) + _i16(self._y) + _f32(self._angle)
+    def _pack_shape(self) -> bytes:
+        return b"\x01" + _CONIC.pack(round(self._x), round(self._y), self._angle)
     
 
-@dataclass
+@dataclass(slots=True)
 class _RadialGradient(CanvasGradient):
     _x0: float
     _y0: float
@@ -178,36 +259,204 @@ class _RadialGradient(CanvasGradient):
     _y1: float
     _r1: float
 
-    def _pack(self) -> bytes:
-        return (super()._pack() + b"\x02" + 
-                _i16(self._x0) + 
-                _i16(self._y0) + 
-                _i16(self._r0) + 
-                _i16(self._x1) + 
-                _i16(self._y1) + 
-                _i16(self._r1))
+    def _pack_shape(self) -> bytes:
+        return (b"\x02" + 
+                _BEZIER.pack(round(self._x0), 
+                             round(self._y0), 
+                             round(self._r0), 
+                             round(self._x1), 
+                             round(self._y1), 
+                             round(self._r1)))
+
+
+@dataclass(slots=True)
+class _Recording:
+    """
+    Events captured between Context2D._begin_recording and Context2D._end_recording,
+    which Context2D._replay can dispatch again without repeating the calls that made them.
+    Replaying saves the Python work of those calls, not bytes: every event is still sent
+    """
+    _context_id: int
+    # Python-side state the events were recorded from, and the state they leave behind
+    _state_before: tuple
+    _flushed_before: dict[int, bytes]
+    _state_after: tuple = ()
+    _flushed_after: dict[int, bytes] = field(default_factory=dict)
+    _last_type: int = -1
+    _last_data: bytes = b""
+    _events: bytearray = field(default_factory=bytearray, repr=False)
+    # Where the recording starts in the shared event buffer
+    _offset: int = 0
 
 
-@dataclass(repr=False)
 class Context2D:
-    __file: ClassVar[TextIO] = open("/dev/canvas", "wb")
+    __fd: ClassVar[int] = os.open("/dev/canvas", os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    __buffer: ClassVar[bytearray] = bytearray()
     __next_id: ClassVar[int] = 0
-
-    __id: int = 0
+    __recording: ClassVar[Optional[_Recording]] = None
+
+    __slots__ = (
+        "__id", "__last_type", "__last_data", "__width", "__height", "__text_rendering",
+        "__line_width", "__line_cap", "__line_join", "__miter_limit", "__line_dash",
+        "__line_dash_offset", "__font", "__text_align", "__text_baseline", "__direction",
+        "__letter_spacing", "__font_kerning", "__font_stretch", "__font_variant_caps",
+        "__word_spacing", "__fill_style", "__stroke_style", "__shadow_blur", "__shadow_color",
+        "__shadow_offset_x", "__shadow_offset_y", "__global_alpha", "__global_composite_operation",
+        "__filter", "__image_smoothing_enabled", "__image_smoothing_quality", "__pending_state",
+        "__flushed_state", "__path_points", "__path_move",
+    )
+
+    __id: int
+    __last_type: int
+    __last_data: bytes
 
     def __init__(self, *, width: float = 300, height: float = 150):
+        self.__pending_state: dict[int, bytes] = {}
+        # Last value of each state setter that was actually sent
+        self.__flushed_state: dict[int, bytes] = {}
+        # Consecutive move_to and line_to calls are buffered as one polyline
+        self.__path_points: list[int] = []
+        self.__path_move = False
+        self.__last_type = -1
+        self.__last_data = b""
         self.__id = Context2D.__next_id
         Context2D.__next_id += 1
         if self.__id >= 256:
             raise Exception("Too many Context2D instances! A program can only have 256 Context2D instances at once")
-        self.__dispatch(0, _i16(width) + _i16(height))
-        self.__width = width
-        self.__height = height
+        # Sizes are stored rounded, as sent, so the setters can compare against them directly
+        self.__width = round(width)
+        self.__height = round(height)
+        self.__dispatch(0, _POINT.pack(self.__width, self.__height))
+
+        # Default canvas state
+        self.__text_rendering = "auto"
+        self.__line_width = 1
+        self.__line_cap = "butt"
+        self.__line_join = "miter"
+        self.__miter_limit = 10
+        self.__line_dash = ()
+        self.__line_dash_offset = 0
+        self.__font = "10px sans-serif"
+        self.__text_align = "start"
+        self.__text_baseline = "alphabetic"
+        self.__direction = "inherit"
+        self.__letter_spacing = "0px"
+        self.__font_kerning = "auto"
+        self.__font_stretch = "normal"
+        self.__font_variant_caps = "normal"
+        self.__word_spacing = "0px"
+        self.__fill_style = "black"
+        self.__stroke_style = "black"
+        self.__shadow_blur = 0
+        self.__shadow_color = "#00000000"
+        self.__shadow_offset_x = 0
+        self.__shadow_offset_y = 0
+        self.__global_alpha = 1
+        self.__global_composite_operation = "source-over"
+        self.__filter = None
+        self.__image_smoothing_enabled = True
+        self.__image_smoothing_quality = "low"
     
     def remove(self):
         self.__dispatch(1) # Remove
-
-    __width: float = 300
+        self.flush()
+
+    @staticmethod
+    def flush():
+        """Writes all buffered events to the canvas"""
+        buffer = Context2D.__buffer
+        if not buffer: return
+        recording = Context2D.__recording
+        if recording is not None:
+            recording._events += buffer[recording._offset:]
+            recording._offset = 0
+        # Partial writes resume through a view so the remaining bytes are not copied
+        fd = Context2D.__fd
+        written = 0
+        try:
+            with memoryview(buffer) as view:
+                while written < len(view):
+                    # Released explicitly, so a traceback holding the slice can't pin the buffer
+                    with view[written:] as rest:
+                        count = os.write(fd, rest)
+                    # A write that makes no progress would otherwise be retried forever
+                    if count == 0:
+                        raise OSError("/dev/canvas accepted no bytes")
+                    written += count
+        finally:
+            # Only the unsent tail is kept, so a failed write never sends an event twice.
+            # That tail was already handed to the recording above, so it is not captured again
+            del buffer[:written]
+            if recording is not None:
+                recording._offset = len(buffer)
+
+    def _begin_recording(self):
+        """Starts capturing the events dispatched by this context, until _end_recording is called"""
+        if Context2D.__recording is not None:
+            raise Exception("A recording is already in progress")
+        self.__flush_pending()
+        # Forget the last event, so an idempotent event at the start of the recording is always kept
+        self.__last_type = -1
+        self.__last_data = b""
+        Context2D.__recording = _Recording(
+            self.__id, _canvas_state(self), dict(self.__flushed_state), _offset=len(self.__buffer))
+
+    def _end_recording(self) -> Optional[_Recording]:
+        """
+        Stops capturing events and returns them as a recording.
+        Returns None if the events can't be replayed, such as when another context dispatched in between
+        """
+        recording = Context2D.__recording
+        if recording is None or recording._context_id != self.__id:
+            raise Exception("This context is not recording")
+        self.__flush_pending()
+        Context2D.__recording = None
+        events = recording._events
+        events += self.__buffer[recording._offset:]
+
+        # Only drawing on this canvas can be replayed, not creating, resizing, removing or committing it.
+        # Resizes take effect as soon as they arrive rather than with the frame, so they can't be repeated
+        offset = 0
+        while offset < len(events):
+            length, event_type, context_id = _HEADER.unpack_from(events, offset)
+            if context_id != self.__id or event_type in (0, 1, 2, 3, 4):
+                return None
+            offset += length + 4
+
+        recording._state_after = _canvas_state(self)
+        recording._flushed_after = dict(self.__flushed_state)
+        recording._last_type = self.__last_type
+        recording._last_data = self.__last_data
+        return recording
+
+    def _abort_recording(self):
+        """Stops capturing events without making a recording. Does nothing unless this context is recording"""
+        recording = Context2D.__recording
+        if recording is not None and recording._context_id == self.__id:
+            Context2D.__recording = None
+
+    def _replay(self, recording: _Recording) -> bool:
+        """
+        Dispatches the events of a recording again, with the same effect as repeating the calls that made them.
+        Returns False, dispatching nothing, unless the context is in the state the recording started from
+        """
+        self.__flush_pending()
+        if (recording._context_id != self.__id
+                or recording._state_before != _canvas_state(self)
+                or recording._flushed_before != self.__flushed_state):
+            return False
+
+        buffer = self.__buffer
+        buffer += recording._events
+        for name, value in zip(_CANVAS_STATE, recording._state_after):
+            setattr(self, name, value)
+        self.__flushed_state = dict(recording._flushed_after)
+        self.__last_type = recording._last_type
+        self.__last_data = recording._last_data
+        if len(buffer) >= _FLUSH_THRESHOLD: self.flush()
+        return True
+
+    __width: int
 
     @property
     def width(self): return self.__width
@@ -216,13 +465,15 @@ class Context2D:
     def width(self, value: float):
         value = round(value)
         if value == self.__width: return
-        self.__dispatch(2, _i16(value))
+        self.__dispatch(2, _I16.pack(value))
+        # Resizing a canvas resets its context state
+        self.__flushed_state.clear()
         self.__width = value
 
     def commit(self):
         self.__dispatch(3)
 
-    __height: float = 150
+    __height: int
 
     @property
     def height(self): return self.__height
@@ -231,7 +482,9 @@ class Context2D:
     def height(self, value: float):
         value = round(value)
         if value == self.__height: return
-        self.__dispatch(4, _i16(value))
+        self.__dispatch(4, _I16.pack(value))
+        # Resizing a canvas resets its context state
+        self.__flushed_state.clear()
         self.__height = value
 
     def clear_rect(self, x: float, y: float, width: float, height: float):
@@ -243,13 +496,29 @@ class Context2D:
     def stroke_rect(self, x: float, y: float, width: float, height: float):
         self.__dispatch_rect(7, x, y, width, height)
 
+    def fill_rects(self, rects: Iterable[tuple[float, float, float, float]]):
+        """Fills each (x, y, width, height) rectangle with the current fill style, as a single event"""
+        coords = [round(c) for x, y, width, height in rects for c in (x, y, width, height)]
+        if not coords: return
+        # Checked before packing, so a bad rectangle can't leave earlier chunks in the buffer
+        if not (-0x8000 <= min(coords) and max(coords) <= 0x7FFF):
+            raise error("rectangle coordinates must be in the int16 range -32768 to 32767")
+        if self.__path_points: self.__flush_path()
+        if self.__pending_state: self.__flush_state()
+        buffer = self.__buffer
+        for start in range(0, len(coords), 4 * _MAX_FILL_RECTS):
+            run = coords[start:start + 4 * _MAX_FILL_RECTS]
+            buffer += pack(f">IBBH{len(run)}h", 2 * len(run) + 4, 61, self.__id, len(run) // 4, *run)
+        self.__last_type = 61
+        if len(buffer) >= _FLUSH_THRESHOLD: self.flush()
+
     def fill_text(self, text: str, x: float, y: float, max_width: float = None):
         self.__dispatch_text(8, text, x, y, max_width)
 
     def stroke_text(self, text: str, x: float, y: float, max_width: float = None):
         self.__dispatch_text(9, text, x, y, max_width)
 
-    __text_rendering: str = "auto"
+    __text_rendering: str
 
     @property
     def text_rendering(self): return self.__text_rendering
@@ -260,7 +529,7 @@ class Context2D:
         self.__dispatch(10, _enum(value, _TEXT_RENDERING))
         self.__text_rendering = value
 
-    __line_width: float = 1
+    __line_width: float
 
     @property
     def line_width(self): return self.__line_width
@@ -271,7 +540,7 @@ class Context2D:
         self.__dispatch(11, _f32(value))
         self.__line_width = value
 
-    __line_cap: str = "butt"
+    __line_cap: str
 
     @property
     def line_cap(self): return self.__line_cap
@@ -282,7 +551,7 @@ class Context2D:
         self.__dispatch(12, _enum(value, _LINE_CAP))
         self.__line_cap = value
 
-    __line_join: str = "miter"
+    __line_join: str
 
     @property
     def line_join(self): return self.__line_join
@@ -293,7 +562,7 @@ class Context2D:
         self.__dispatch(13, _enum(value, _LINE_JOIN))
         self.__line_join = value
 
-    __miter_limit: float = 10
+    __miter_limit: float
 
     @property
     def miter_limit(self): return self.__miter_limit
@@ -304,16 +573,20 @@ class Context2D:
         self.__dispatch(14, _f32(value))
         self.__miter_limit = value
 
-    __line_dash: list[int] = field(default_factory=list)
+    # Stored as a tuple so that callers mutating their list can't alias our state
+    __line_dash: tuple[int, ...]
 
-    def get_line_dash(self): return self.__line_dash[:]
+    def get_line_dash(self): return list(self.__line_dash)
 
     def set_line_dash(self, dashes: list[int]):
+        dashes = tuple(map(round, dashes))
         if dashes == self.__line_dash: return
-        self.__dispatch(15, pack("B" * (len(dashes) + 1), len(dashes), *dashes))
+        if len(dashes) > 255 or not all(0 <= dash <= 255 for dash in dashes):
+            raise ValueError(f"Invalid line dash: {list(dashes)}. A line dash can have up to 255 segments, each between 0 and 255")
+        self.__dispatch(15, bytes((len(dashes), *dashes)))
         self.__line_dash = dashes
 
-    __line_dash_offset: float = 0
+    __line_dash_offset: float
     
     @property
     def line_dash_offset(self): return self.__line_dash_offset
@@ -324,7 +597,7 @@ class Context2D:
         self.__dispatch(16, _f32(value))
         self.__line_dash_offset = value
 
-    __font: str = "10px sans-serif"
+    __font: str
 
     @property
     def font(self): return self.__font
@@ -335,7 +608,7 @@ class Context2D:
         self.__dispatch(17, _str(value))
         self.__font = value 
 
-    __text_align: str = "start"
+    __text_align: str
 
     @property
     def text_align(self): return self.__text_align
@@ -346,7 +619,7 @@ class Context2D:
         self.__dispatch(18, _enum(value, _TEXT_ALIGN))
         self.__text_align = value
 
-    __text_baseline: str = "alphabetic"
+    __text_baseline: str
 
     @property
     def text_baseline(self): return self.__text_baseline
@@ -357,7 +630,7 @@ class Context2D:
         self.__dispatch(19, _enum(value, _TEXT_BASELINE))
         self.__text_baseline = value
 
-    __direction: str = "inherit"
+    __direction: str
 
     @property
     def direction(self): return self.__direction
@@ -368,7 +641,7 @@ class Context2D:
         self.__dispatch(20, _enum(value, _DIRECTION))
         self.__direction = value
     
-    __letter_spacing: str = "0px"
+    __letter_spacing: str
 
     @property
     def letter_spacing(self): return self.__letter_spacing
@@ -379,7 +652,7 @@ class Context2D:
         self.__dispatch(21, _str(value))
         self.__letter_spacing = value
 
-    __font_kerning: str = "auto"
+    __font_kerning: str
 
     @property
     def font_kerning(self): return self.__font_kerning
@@ -390,7 +663,7 @@ class Context2D:
         self.__dispatch(22, _enum(value, _FONT_KERNING))
         self.__font_kerning = value
 
-    __font_stretch: str = "normal"
+    __font_stretch: str
 
     @property
     def font_stretch(self): return self.__font_stretch
@@ -401,7 +674,7 @@ class Context2D:
         self.__dispatch(23, _enum(value, _FONT_STRETCH))
         self.__font_stretch = value
 
-    __font_variant_caps: str = "normal"
+    __font_variant_caps: str
 
     @property
     def font_variant_caps(self): return self.__font_variant_caps
@@ -412,7 +685,7 @@ class Context2D:
         self.__dispatch(24, _enum(value, _FONT_VARIANT_CAPS))
         self.__font_variant_caps = value
 
-    __word_spacing: str = "0px"
+    __word_spacing: str
 
     @property
     def word_spacing(self): return self.__word_spacing
@@ -425,39 +698,40 @@ class Context2D:
 
     
     def create_linear_gradient(self, x0: float, y0: float, x1: float, y1: float):
-        return _LinearGradient([], _x0=x0, _y0=y0, _x1=x1, _y1=y1)
+        return _LinearGradient(_x0=x0, _y0=y0, _x1=x1, _y1=y1)
 
     def create_conic_gradient(self, x: float, y: float, angle: float):
-        return _ConicGradient([], _x=x, _y=y, _angle=angle)
+        return _ConicGradient(_x=x, _y=y, _angle=angle)
     
     def create_radial_gradient(self, x0: float, y0: float, r0: float, x1: float, y1: float, r1: float):
-        return _RadialGradient([], _x0=x0, _y0=y0, _r0=r0, _x1=x1, _y1=y1, _r1=r1)
+        return _RadialGradient(_x0=x0, _y0=y0, _r0=r0, _x1=x1, _y1=y1, _r1=r1)
     
 
-    __fill_style: CanvasGradient | str = "black"
+    __fill_style: CanvasGradient | str
 
     @property
     def fill_style(self): return self.__fill_style
 
     @fill_style.setter
     def fill_style(self, value: CanvasGradient | str):
-        if value == self.__fill_style: return
+        # Gradients are compared by identity so that we never walk their stops
+        if value is self.__fill_style or (isinstance(value, str) and value == self.__fill_style): return
         self.__dispatch_style(26, value)
         self.__fill_style = value
 
 
-    __stroke_style: CanvasGradient | str = "black"
+    __stroke_style: CanvasGradient | str
 
     @property
     def stroke_style(self): return self.__stroke_style
 
     @stroke_style.setter
     def stroke_style(self, value: CanvasGradient | str):
-        if value == self.__stroke_style: return
+        if value is self.__stroke_style or (isinstance(value, str) and value == self.__stroke_style): return
         self.__dispatch_style(27, value)
         self.__stroke_style = value
 
-    __shadow_blur: float = 0
+    __shadow_blur: float
 
     @property
     def shadow_blur(self): return self.__shadow_blur
@@ -468,7 +742,7 @@ class Context2D:
         self.__dispatch(28, _f32(value))
         self.__shadow_blur = value
 
-    __shadow_color: str = "#00000000"
+    __shadow_color: str
     
     @property
     def shadow_color(self): return self.__shadow_color
@@ -479,7 +753,7 @@ class Context2D:
         self.__dispatch(29, _str(value))
         self.__shadow_color = value
 
-    __shadow_offset_x: float = 0
+    __shadow_offset_x: float
 
     @property
     def shadow_offset_x(self): return self.__shadow_offset_x
@@ -490,7 +764,7 @@ class Context2D:
         self.__dispatch(30, _f32(value))
         self.__shadow_offset_x = value
 
-    __shadow_offset_y: float = 0
+    __shadow_offset_y: float
 
     @property
     def shadow_offset_y(self): return self.__shadow_offset_y
@@ -509,73 +783,93 @@ class Context2D:
         self.__dispatch(33)
 
     def move_to(self, x: float, y: float):
-        self.__dispatch(34, _i16(x) + _i16(y))
+        point = _point(x, y)
+        points = self.__path_points
+        # A move straight after another move replaces it, since a lone point draws nothing
+        if points and not (self.__path_move and len(points) == 2):
+            self.__flush_path()
+        self.__path_move = True
+        points[:] = point
 
     def line_to(self, x: float, y: float):
-        self.__dispatch(35, _i16(x) + _i16(y))
+        point = _point(x, y)
+        points = self.__path_points
+        if len(points) >= 2 * _MAX_POLYLINE_POINTS:
+            self.__flush_path()
+        points += point
+
+    def polyline(self, points: Iterable[tuple[float, float]], close: bool = False):
+        """Moves to the first point and draws lines through the rest, optionally closing the path"""
+        # Unpacking each point rejects any that is not an (x, y) pair, which would misalign the count
+        coords = [round(c) for x, y in points for c in (x, y)]
+        if coords:
+            if not (-0x8000 <= min(coords) and max(coords) <= 0x7FFF):
+                raise error("path coordinates must be in the int16 range -32768 to 32767")
+            if self.__path_points:
+                self.__flush_path()
+            self.__path_move = True
+            self.__path_points += coords
+        if close:
+            self.close_path()
 
     def bezier_curve_to(self, cp1x: float, cp1y: float, cp2x: float, cp2y: float, x: float, y: float):
-        self.__dispatch(36, 
-                        _i16(cp1x) + 
-                        _i16(cp1y) + 
-                        _i16(cp2x) + 
-                        _i16(cp2y) + 
-                        _i16(x) + 
-                        _i16(y))
+        self.__dispatch(36, _BEZIER.pack(
+                        round(cp1x), 
+                        round(cp1y), 
+                        round(cp2x), 
+                        round(cp2y), 
+                        round(x), 
+                        round(y)))
 
     def quadratic_curve_to(self, cpx: float, cpy: float, x: float, y: float):
-        self.__dispatch(37, 
-                        _i16(cpx) + 
-                        _i16(cpy) + 
-                        _i16(x) + 
-                        _i16(y))
+        self.__dispatch(37, _RECT.pack(
+                        round(cpx), 
+                        round(cpy), 
+                        round(x), 
+                        round(y)))
 
     def arc(self, x: float, y: float, radius: float, start_angle: float, end_angle: float, counterclockwise: bool = False):
-        self.__dispatch(38, 
-                        _i16(x) + 
-                        _i16(y) + 
-                        _i16(radius) + 
-                        _f32(start_angle) + 
-                        _f32(end_angle) + 
-                        _bool(counterclockwise))
+        self.__dispatch(38, _ARC.pack(
+                        round(x), 
+                        round(y), 
+                        round(radius), 
+                        start_angle, 
+                        end_angle, 
+                        counterclockwise))
         
 
     def arc_to(self, x1: float, y1: float, x2: float, y2: float, radius: float):
-        self.__dispatch(39, 
-                        _i16(x1) + 
-                        _i16(y1) + 
-                        _i16(x2) + 
-                        _i16(y2) + 
-                        _i16(radius))
+        self.__dispatch(39, _ARC_TO.pack(
+                        round(x1), 
+                        round(y1), 
+                        round(x2), 
+                        round(y2), 
+                        round(radius)))
         
     def ellipse(self, x: float, y: float, radius_x: float, radius_y: float, rotation: float, start_angle: float, end_angle: float, counterclockwise: bool = False):
-        self.__dispatch(40, 
-                        _i16(x) + 
-                        _i16(y) + 
-                        _i16(radius_x) + 
-                        _i16(radius_y) + 
-                        _f32(rotation) + 
-                        _f32(start_angle) + 
-                        _f32(end_angle) + 
-                        _bool(counterclockwise))
+        self.__dispatch(40, _ELLIPSE.pack(
+                        round(x), 
+                        round(y), 
+                        round(radius_x), 
+                        round(radius_y), 
+                        rotation, 
+                        start_angle, 
+                        end_angle, 
+                        counterclockwise))
         
     def rect(self, x: float, y: float, width: float, height: float):
         self.__dispatch_rect(41, x, y, width, height)
 
     def round_rect(self, x: float, y: float, width: float, height: float, radii: float | list[float]):
-        if isinstance(radii, float):
+        if isinstance(radii, (int, float)):
             radii = [radii]
 
         if len(radii) > 4:
             raise ValueError("Too many radii! A round rect can specify at most 4 radii for each corner")
 
         self.__dispatch(42, 
-                        _i16(x) + 
-                        _i16(y) + 
-                        _i16(width) + 
-                        _i16(height) + 
-                        len(radii).to_bytes(1) + 
-                        b"".join(_i16(r) for r in radii))
+                        _RECT.pack(round(x), round(y), round(width), round(height)) + 
+                        pack(f">B{len(radii)}h", len(radii), *map(round, radii)))
         
     def fill(self, fill_rule: str = "nonzero"):
         self.__dispatch(43, _enum(fill_rule, _FILL_RULE))
@@ -590,10 +884,10 @@ class Context2D:
         self.__dispatch(46, _f32(angle))
 
     def scale(self, x: float, y: float):
-        self.__dispatch(47, _f32(x) + _f32(y))
+        self.__dispatch(47, _VECTOR.pack(x, y))
 
     def translate(self, x: float, y: float):
-        self.__dispatch(48, _i16(x) + _i16(y))
+        self.__dispatch(48, _VECTOR.pack(x, y))
 
     def transform(self, m11: float, m12: float, m21: float, m22: float, m31: float, m32: float):
         self.__dispatch_transform(49, m11, m12, m21, m22, m31, m32)
@@ -604,7 +898,7 @@ class Context2D:
     def reset_transform(self):
         self.__dispatch(51)
 
-    __global_alpha: float = 1
+    __global_alpha: float
 
     @property
     def global_alpha(self): return self.__global_alpha
@@ -615,7 +909,7 @@ class Context2D:
         self.__dispatch(52, _f32(value))
         self.__global_alpha = value
 
-    __global_composite_operation: str = "source-over"
+    __global_composite_operation: str
 
     @property
     def global_composite_operation(self): return self.__global_composite_operation
@@ -626,7 +920,7 @@ class Context2D:
         self.__dispatch(53, _enum(value, _GLOBAL_COMPOSITE_OPERATION))
         self.__global_composite_operation = value
 
-    __filter: str = None
+    __filter: str
 
     @property
     def filter(self): return self.__filter
@@ -634,10 +928,10 @@ class Context2D:
     @filter.setter
     def filter(self, value: str):
         if value == self.__filter: return
-        self.__filter = value
         self.__dispatch(54, _str(value))
+        self.__filter = value
 
-    __image_smoothing_enabled: bool = True
+    __image_smoothing_enabled: bool
 
     @property
     def image_smoothing_enabled(self): return self.__image_smoothing_enabled
@@ -648,7 +942,7 @@ class Context2D:
         self.__dispatch(57, _bool(value))
         self.__image_smoothing_enabled = value
 
-    __image_smoothing_quality: str = "low"
+    __image_smoothing_quality: str
 
     @property
     def image_smoothing_quality(self): return self.__image_smoothing_quality
@@ -660,28 +954,82 @@ class Context2D:
         self.__image_smoothing_quality = value
 
     def __dispatch(self, event_type: int, data: bytes = b""):
-        self.__file.write((len(data) + 2).to_bytes(4))
-        self.__file.write(event_type.to_bytes(1))
-        self.__file.write(self.__id.to_bytes(1))
-        self.__file.write(data)
-
-        # Flush file on commit event
-        if event_type == 3:
-            self.__file.flush()
+        if event_type in _STATE_EVENTS:
+            self.__pending_state[event_type] = data
+            return
+        if self.__path_points:
+            self.__flush_path()
+        if self.__pending_state and event_type not in _PATH_EVENTS:
+            self.__flush_state()
+
+        # Drop an idempotent event that exactly repeats the previous one from this instance
+        if event_type == self.__last_type and event_type in _IDEMPOTENT_EVENTS and data == self.__last_data:
+            return
+        self.__last_type = event_type
+        self.__last_data = data
+
+        buffer = self.__buffer
+        buffer += _HEADER.pack(len(data) + 2, event_type, self.__id)
+        buffer += data
+
+        # Flush buffer on commit event or once it gets large enough
+        if event_type == 3 or len(buffer) >= _FLUSH_THRESHOLD:
+            self.flush()
+
+
+    def __flush_pending(self):
+        if self.__path_points: self.__flush_path()
+        if self.__pending_state: self.__flush_state()
+
+
+    def __flush_state(self):
+        buffer = self.__buffer
+        flushed = self.__flushed_state
+        for event_type, data in self.__pending_state.items():
+            # A property that was changed and changed back since the last draw needs no event
+            if flushed.get(event_type) == data: continue
+            flushed[event_type] = data
+            buffer += _HEADER.pack(len(data) + 2, event_type, self.__id)
+            buffer += data
+        self.__pending_state.clear()
+
+
+    def __flush_path(self):
+        points = self.__path_points
+        buffer = self.__buffer
+        move = self.__path_move
+        # The points are dropped even if packing fails, so one bad path can't break later draws
+        try:
+            for start in range(0, len(points), 2 * _MAX_POLYLINE_POINTS):
+                run = points[start:start + 2 * _MAX_POLYLINE_POINTS]
+                if len(run) == 2:
+                    # A single point is smaller as a plain move_to or line_to
+                    event_type = 34 if move else 35
+                    buffer += _POINT_EVENT.pack(6, event_type, self.__id, *run)
+                else:
+                    event_type = 60
+                    buffer += pack(f">IBB?H{len(run)}h", 2 * len(run) + 5, 60, self.__id, move, len(run) // 2, *run)
+                move = False
+            self.__last_type = event_type
+        finally:
+            self.__path_move = False
+            points.clear()
 
 
     def __dispatch_rect(self, event_type: int, x: float, y: float, width: float, height: float):
-        self.__dispatch(event_type, 
-            _i16(x) + 
-            _i16(y) + 
-            _i16(width) + 
-            _i16(height))
+        if self.__path_points: self.__flush_path()
+        if self.__pending_state: self.__flush_state()
+        buffer = self.__buffer
+        buffer += _RECT_EVENT.pack(10, event_type, self.__id, round(x), round(y), round(width), round(height))
+        self.__last_type = event_type
+        if len(buffer) >= _FLUSH_THRESHOLD: self.flush()
     
 
     def __dispatch_text(self, event_type: int, text: str, x: float, y: float, max_width: Optional[float] = None):
-        data = _bool(max_width is not None) + _str(text) + _i16(x) + _i16(y)
-        if max_width is not None:
-            data += _i16(max_width)
+        if max_width is None:
+            data = b"".join((b"\x00", _str(text), _POINT.pack(round(x), round(y))))
+        else:
+            data = b"".join((b"\x01", _str(text), _POINT.pack(round(x), round(y)), _i16(max_width)))
         self.__dispatch(event_type, data)
 
 
@@ -693,10 +1041,20 @@ class Context2D:
         self.__dispatch(event_type, data)
 
     def __dispatch_transform(self, event_type: int, m11: float, m12: float, m21: float, m22: float, m31: float, m32: float):
-        self.__dispatch(event_type, 
-                        _f32(m11) + 
-                        _f32(m12) + 
-                        _f32(m21) + 
-                        _f32(m22) + 
-                        _f32(m31) + 
-                        _f32(m32))
\ No newline at end of file
+        self.__dispatch(event_type, _MATRIX.pack(m11, m12, m21, m22, m31, m32))
+
+
+# Python-side copies of the canvas state, which decide what the setters dispatch
+_CANVAS_STATE = tuple(f"_Context2D__{name}" for name in (
+    "width", "height", "text_rendering", "line_width", "line_cap", "line_join", "miter_limit",
+    "line_dash", "line_dash_offset", "font", "text_align", "text_baseline", "direction",
+    "letter_spacing", "font_kerning", "font_stretch", "font_variant_caps", "word_spacing",
+    "fill_style", "stroke_style", "shadow_blur", "shadow_color", "shadow_offset_x",
+    "shadow_offset_y", "global_alpha", "global_composite_operation", "filter",
+    "image_smoothing_enabled", "image_smoothing_quality",
+))
+_canvas_state = attrgetter(*_CANVAS_STATE)
+
+
+# Make sure events that were never committed still reach the canvas
+atexit.register(Context2D.flush)
@@ -1,18 +1,33 @@
 from abc import ABC, abstractmethod
+import atexit
 import math
 from types import NoneType
 from context2d import Context2D
-import weakref
 
 _DEFAULT_OUTLINE_WIDTH = 1
 
+# Side of a find_overlapping grid cell, and the most cells a shape is filed under before it is
+# checked on every query instead
+_GRID_CELL = 64
+_GRID_MAX_CELLS = 256
+_FULL_TURN = 2 * math.pi
+
+# Accepted parameter types, built once rather than on every call
+_NUMBER = (float, int)
+_OPTIONAL_NUMBER = (float, int, NoneType)
+_STRING = (str,)
+_OPTIONAL_STRING = (str, NoneType)
+_FONT_SIZE = (str, int, float)
+_BOOL = (bool,)
+
 
 def _unsupported(function_name):
     raise NotImplementedError(f"{function_name} is not yet supported! It will be supported in a future release of this library!")
 
 
 def _param(var, var_types, param_name, function_name):
-    assert type(var) in var_types, (
+    # bool is a subclass of int, but is only accepted where it is asked for
+    assert isinstance(var, var_types) and (var.__class__ is not bool or bool in var_types), (
         param_name
         + " should be one of the following types: "
         + ", ".join([x.__name__ for x in var_types])
@@ -31,44 +46,54 @@ def _line_aabb_test(x1, y1, x2, y2, X1, Y1, X2, Y2):
     xmin, xmax = min(X1, X2), max(X1, X2)
     ymin, ymax = min(Y1, Y2), max(Y1, Y2)
 
+    # Cohen-Sutherland outcodes settle the common cases without any division:
+    # both endpoints inside the box, or both beyond the same edge
+    code1 = (x1 < xmin) | (x1 > xmax) << 1 | (y1 < ymin) << 2 | (y1 > ymax) << 3
+    code2 = (x2 < xmin) | (x2 > xmax) << 1 | (y2 < ymin) << 2 | (y2 > ymax) << 3
+    if code1 & code2:
+        return False
+    if not code1 | code2:
+        return True
+
     # Liang-Barsky line clipping algorithm
     dx = x2 - x1
     dy = y2 - y1
 
     tmin, tmax = 0.0, 1.0
 
-    def clip(p, q):
-        nonlocal tmin, tmax
-        if p == 0:
-            if q < 0:
-                return False
-            return True
-        t = q / p
-        if p < 0:
-            if t > tmax:
-                return False
-            if t > tmin:
-                tmin = t
-        else:
-            if t < tmin:
-                return False
-            if t < tmax:
-                tmax = t
-        return True
-
-    if not clip(-dx, x1 - xmin):
-        return False
-    if not clip(dx, xmax - x1):
-        return False
-    if not clip(-dy, y1 - ymin):
+    # Each axis clips against both of its edges at once. The sign of the direction decides which
+    # edge the line enters through (raising tmin) and which it leaves through (lowering tmax)
+
+    # Left and right edges
+    if dx:
+        t0 = (xmin - x1) / dx
+        t1 = (xmax - x1) / dx
+        if dx < 0: t0, t1 = t1, t0
+        if t0 > tmin: tmin = t0
+        if t1 < tmax: tmax = t1
+        if tmin > tmax:
+            return False
+    elif x1 < xmin or x1 > xmax:
         return False
-    if not clip(dy, ymax - y1):
+
+    # Top and bottom edges
+    if dy:
+        t0 = (ymin - y1) / dy
+        t1 = (ymax - y1) / dy
+        if dy < 0: t0, t1 = t1, t0
+        if t0 > tmin: tmin = t0
+        if t1 < tmax: tmax = t1
+        if tmin > tmax:
+            return False
+    elif y1 < ymin or y1 > ymax:
         return False
 
     return True
 
 
 class _Shape(ABC):
+    __slots__ = ("x", "y", "width", "height", "hidden", "fill", "outline", "line_width")
+
     x: float                        # The x coordinate of the shape. Shape-specific meaning
     y: float                        # The y coordinate of the shape. Shape-specific meaning
     width: float | None             # The width of the shape (in pixels)
@@ -79,12 +104,12 @@ class _Shape(ABC):
     line_width: float | None        # Outline width. If None, outline has default width
 
     def __init__(self, x: float, y: float, fill, outline, width, color, function_name: str):
-        _param(x, [float, int], "x", function_name)
-        _param(y, [float, int], "y", function_name)
-        _param(fill, [str, NoneType], "fill", function_name)
-        _param(outline, [str, NoneType], "outline", function_name)
-        _param(width, [float, int, NoneType], "width", function_name)
-        _param(color, [str, NoneType], "color", function_name)
+        _param(x, _NUMBER, "x", function_name)
+        _param(y, _NUMBER, "y", function_name)
+        _param(fill, _OPTIONAL_STRING, "fill", function_name)
+        _param(outline, _OPTIONAL_STRING, "outline", function_name)
+        _param(width, _OPTIONAL_NUMBER, "width", function_name)
+        _param(color, _OPTIONAL_STRING, "color", function_name)
         self.x = x
         self.y = y
         self.hidden = False
@@ -123,64 +148,113 @@ class _Shape(ABC):
     def overlaps(self, x1, y1, x2, y2) -> bool:
         pass
 
+    def bounds(self) -> tuple[float, float, float, float] | None:
+        """
+        Returns a box (xmin, ymin, xmax, ymax) containing every point that overlaps can match,
+        or None if the shape never overlaps anything
+        """
+        return None
 
-class _Rectangle(_Shape):
 
-    def __init__(self, x1, y1, x2, y2, fill="black", outline=None, width=None, color=None):
-        super().__init__(x1, y1, fill, outline, width, color, "create_rectangle")
-        _param(x2, [float, int], "x2", "create_rectangle")
-        _param(y2, [float, int], "y2", "create_rectangle")
+class _BoxShape(_Shape):
+    __slots__ = ("x2", "y2")
+
+    x2: float                       # The right edge of the shape's bounding box
+    y2: float                       # The bottom edge of the shape's bounding box
+
+    def __init__(self, x1, y1, x2, y2, fill, outline, width, color, function_name: str):
+        super().__init__(x1, y1, fill, outline, width, color, function_name)
+        _param(x2, _NUMBER, "x2", function_name)
+        _param(y2, _NUMBER, "y2", function_name)
         self.width = x2 - x1
         self.height = y2 - y1
+        self.x2 = x2
+        self.y2 = y2
+
+    # The far corner is kept in sync so that overlap tests can compare coordinates directly
+    def move_to(self, x: float, y: float):
+        super().move_to(x, y)
+        self.x2 = self.x + self.width
+        self.y2 = self.y + self.height
+
+    def move(self, dx: float, dy: float):
+        super().move(dx, dy)
+        self.x2 = self.x + self.width
+        self.y2 = self.y + self.height
+
+    def bounds(self) -> tuple[float, float, float, float] | None:
+        return min(self.x, self.x2), min(self.y, self.y2), max(self.x, self.x2), max(self.y, self.y2)
+
+
+class _Rectangle(_BoxShape):
+    __slots__ = ()
+
+    def __init__(self, x1, y1, x2, y2, fill="black", outline=None, width=None, color=None):
+        super().__init__(x1, y1, x2, y2, fill, outline, width, color, "create_rectangle")
 
     def _draw(self, ctx):
         if self.fill: ctx.fill_rect(self.x, self.y, self.width, self.height)
         if self.outline: ctx.stroke_rect(self.x, self.y, self.width, self.height)
 
     def overlaps(self, x1, y1, x2, y2) -> bool:
-        return self.x <= x2 and self.x + self.width >= x1 and self.y <= y2 and self.y + self.height >= y1
+        return self.x <= x2 and self.x2 >= x1 and self.y <= y2 and self.y2 >= y1
 
 
-class _Oval(_Shape):
+class _Oval(_BoxShape):
+    __slots__ = ("_cx", "_cy", "_rx", "_ry", "_inv_rx", "_inv_ry")
 
     def __init__(self, x1, y1, x2, y2, fill="black", outline=None, width=None, color=None):
-        super().__init__(x1, y1, fill, outline, width, color, "create_oval")
-        _param(x2, [float, int], "x2", "create_oval")
-        _param(y2, [float, int], "y2", "create_oval")
-        self.width = x2 - x1
-        self.height = y2 - y1
+        super().__init__(x1, y1, x2, y2, fill, outline, width, color, "create_oval")
+        # The radii never change, so their inverses are computed once for the overlap test
+        self._rx = self.width / 2
+        self._ry = self.height / 2
+        self._inv_rx = 1 / self._rx if self._rx else 0.0
+        self._inv_ry = 1 / self._ry if self._ry else 0.0
+        self._cx = self.x + self._rx
+        self._cy = self.y + self._ry
+
+    def move_to(self, x: float, y: float):
+        super().move_to(x, y)
+        self._cx = self.x + self._rx
+        self._cy = self.y + self._ry
+
+    def move(self, dx: float, dy: float):
+        super().move(dx, dy)
+        self._cx = self.x + self._rx
+        self._cy = self.y + self._ry
 
     def _draw(self, ctx):
-        radius_x = self.width / 2
-        radius_y = self.height / 2
         ctx.begin_path()
-        ctx.ellipse(self.x + radius_x, self.y + radius_y, radius_x, radius_y, 0, 0, 2 * math.pi)
+        ctx.ellipse(self._cx, self._cy, self._rx, self._ry, 0, 0, _FULL_TURN)
         if self.fill: ctx.fill()
         if self.outline: ctx.stroke()
 
     def overlaps(self, x1, y1, x2, y2) -> bool:
-        Cx = self.x + self.width / 2
-        Cy = self.y + self.height / 2
-        rx = self.width / 2
-        ry = self.height / 2
+        # A flat oval is a line segment, which is exactly its bounding box
+        if not self._inv_rx or not self._inv_ry:
+            return self.x <= x2 and self.x2 >= x1 and self.y <= y2 and self.y2 >= y1
+
+        Cx = self._cx
+        Cy = self._cy
 
         # Clamp point on rect to center of ellipse
         px = max(x1, min(Cx, x2))
         py = max(y1, min(Cy, y2))
 
         # Normalize and test ellipse inequality
-        dx = (px - Cx) / rx
-        dy = (py - Cy) / ry
+        dx = (px - Cx) * self._inv_rx
+        dy = (py - Cy) * self._inv_ry
 
         return dx * dx + dy * dy <= 1
 
 
 class _Line(_Shape):
+    __slots__ = ()
 
     def __init__(self, x1, y1, x2, y2, fill="black", width=1, color=None):
         super().__init__(x1, y1, fill, None, width, color, "create_line")
-        _param(x2, [float, int], "x2", "create_line")
-        _param(y2, [float, int], "y2", "create_line")
+        _param(x2, _NUMBER, "x2", "create_line")
+        _param(y2, _NUMBER, "y2", "create_line")
         self.width = x2 - x1
         self.height = y2 - y1
 
@@ -200,9 +274,29 @@ class _Line(_Shape):
 
     def overlaps(self, x1, y1, x2, y2) -> bool:
         return _line_aabb_test(self.x, self.y, self.x + self.width, self.y + self.height, x1, y1, x2, y2)
+
+    def bounds(self) -> tuple[float, float, float, float] | None:
+        x2 = self.x + self.width
+        y2 = self.y + self.height
+        return min(self.x, x2), min(self.y, y2), max(self.x, x2), max(self.y, y2)
     
 
+# Maps a text anchor to the text_align and text_baseline that place the text around it
+_ANCHORS = {
+    "nw": ("left", "top"),
+    "ne": ("right", "top"),
+    "sw": ("left", "bottom"),
+    "se": ("right", "bottom"),
+    "center": ("center", "middle"),
+    "n": ("center", "top"),
+    "s": ("center", "bottom"),
+    "e": ("right", "middle"),
+    "w": ("left", "middle"),
+}
+
+
 class _Text(_Shape):
+    __slots__ = ("font", "anchor", "text", "_text_align", "_text_baseline")
 
     font: str
     anchor: str
@@ -210,61 +304,30 @@ class _Text(_Shape):
 
     def __init__(self, x, y, text, font = "Arial", font_size="12", fill="black", anchor = "nw", outline=None, width=None, color=None):
         super().__init__(x, y, fill, outline, width, color, "create_text")
-        _param(text, [str], "text", "create_text")
-        _param(font, [str], "font", "create_text")
-        _param(font_size, [str, int, float], "font_size", "create_text")
-        _param(anchor, [str], "anchor", "create_text")
-        
-        # If font size is not a string, convert it to a string
-        if type(font_size) != str:
-            font_size = f"{str(font_size)}px"
-        font_size = font_size.strip()
+        _param(text, _STRING, "text", "create_text")
+        _param(font, _STRING, "font", "create_text")
+        _param(font_size, _FONT_SIZE, "font_size", "create_text")
+        _param(anchor, _STRING, "anchor", "create_text")
         
         # If font size is just a number, add "px" to the end
         # This ensures compatibility with the standalone CS 106A version of this library
-        try:
-            numeric_font_size = float(font_size)
-            font_size = f"{numeric_font_size}px"
-        except ValueError:
-            pass
-
-        self.font = f"{font_size} {font}"
+        if not isinstance(font_size, str):
+            self.font = f"{font_size}px {font}"
+        else:
+            font_size = font_size.strip()
+            try:
+                self.font = f"{float(font_size)}px {font}"
+            except ValueError:
+                self.font = f"{font_size} {font}"
         self.anchor = anchor
         self.text = text
+        self._text_align, self._text_baseline = _ANCHORS.get(anchor, ("start", "top"))
 
     def _draw(self, ctx):
         ctx.font = self.font
 
-        if self.anchor == "nw":
-            ctx.text_align = "left"
-            ctx.text_baseline = "top"
-        elif self.anchor == "ne":
-            ctx.text_align = "right"
-            ctx.text_baseline = "top"
-        elif self.anchor == "sw":
-            ctx.text_align = "left"
-            ctx.text_baseline = "bottom"
-        elif self.anchor == "se":
-            ctx.text_align = "right"
-            ctx.text_baseline = "bottom"
-        elif self.anchor == "center":
-            ctx.text_align = "center"
-            ctx.text_baseline = "middle"
-        elif self.anchor == "n":
-            ctx.text_align = "center"
-            ctx.text_baseline = "top"
-        elif self.anchor == "s":
-            ctx.text_align = "center"
-            ctx.text_baseline = "bottom"
-        elif self.anchor == "e":
-            ctx.text_align = "right"
-            ctx.text_baseline = "middle"
-        elif self.anchor == "w":
-            ctx.text_align = "left"
-            ctx.text_baseline = "middle"
-        else:
-            ctx.text_align = "start"
-            ctx.text_baseline = "top"
+        ctx.text_align = self._text_align
+        ctx.text_baseline = self._text_baseline
 
         if self.fill: ctx.fill_text(self.text, self.x, self.y)
         if self.outline: ctx.stroke_text(self.text, self.x, self.y)
@@ -281,6 +344,7 @@ class _Text(_Shape):
 
 
 class _Polygon(_Shape):
+    __slots__ = ("points",)
 
     points: list[tuple[float, float]]
 
@@ -294,17 +358,15 @@ class _Polygon(_Shape):
 
         super().__init__(ref_x, ref_y, fill, outline, width, color, "create_polygon")
 
-        self.points = []
-        for i in range(0, len(args), 2):
-            self.points.append((args[i] - ref_x, args[i + 1] - ref_y))
+        coords = iter(args)
+        self.points = [(x - ref_x, y - ref_y) for x, y in zip(coords, coords)]
 
     def _draw(self, ctx):
         if len(self.points) == 0: return
+        x = self.x
+        y = self.y
         ctx.begin_path()
-        ctx.move_to(self.points[0][0] + self.x, self.points[0][1] + self.y)
-        for i in range(1, len(self.points)):
-            ctx.line_to(self.points[i][0] + self.x, self.points[i][1] + self.y)
-        ctx.close_path()
+        ctx.polyline([(px + x, py + y) for px, py in self.points], close=True)
         if self.fill: ctx.fill()
         if self.outline: ctx.stroke()
 
@@ -332,20 +394,41 @@ class Canvas:
     __ctx: Context2D
     __elems: dict[str, _Shape]
 
+    # Uniform grid over shape bounds, used by find_overlapping to skip far away shapes
+    __grid: dict[tuple[int, int], set[str]]     # Cell -> ids of the shapes whose bounds touch it
+    __cells: dict[str, list[tuple[int, int]]]   # Id -> cells the shape is filed under
+    __large: set[str]                           # Ids of shapes too large to file cell by cell
+    __stale: set[str]                           # Ids created or moved since they were last filed
+
+    __dirty: bool                               # If shapes changed since the last update
+    __visible: list[_Shape] | None              # Shapes update draws, in creation order. None if stale
+
     def __init__(self, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT):
-        _param(width, [float, int], "width", "Canvas")
-        _param(height, [float, int], "height", "Canvas")
+        _param(width, _NUMBER, "width", "Canvas")
+        _param(height, _NUMBER, "height", "Canvas")
         self.__ctx = Context2D(width=width, height=height)
         self.__elems = {}
+        self.__grid = {}
+        self.__cells = {}
+        self.__large = set()
+        self.__stale = set()
+        self.__dirty = True
+        self.__visible = None
 
-        # This makes sure that the canvas gets rendered when the object is finally deleted
-        weakref.finalize(self, self.update)
+        # This makes sure that the canvas gets rendered when the program exits
+        _canvases.append(self)
 
     def update(self):
-        for elem in self.__elems.values():
-            if elem.hidden: continue
-            elem.draw(self.__ctx)
-        self.__ctx.commit()
+        # The last committed frame is still on screen, so an unchanged canvas needs no new one
+        if not self.__dirty: return
+        ctx = self.__ctx
+        visible = self.__visible
+        if visible is None:
+            visible = self.__visible = [elem for elem in self.__elems.values() if not elem.hidden]
+        for elem in visible:
+            elem.draw(ctx)
+        ctx.commit()
+        self.__dirty = False
 
     def create_rectangle(self, *args, **kwargs) -> str:
         return self._create(_Rectangle(*args, **kwargs))
@@ -369,43 +452,53 @@ class Canvas:
         return self._create(_Polygon(*args, **kwargs))
     
     def move(self, objectId, dx, dy):
-        _param(objectId, [str], "objectId", "move")
-        _param(dx, [float, int], "dx", "move")
-        _param(dy, [float, int], "dy", "move")
+        _param(objectId, _STRING, "objectId", "move")
+        _param(dx, _NUMBER, "dx", "move")
+        _param(dy, _NUMBER, "dy", "move")
         if objectId not in self.__elems: return
         self.__elems[objectId].move(dx, dy)
+        self.__stale.add(objectId)
+        self.__dirty = True
 
     def moveto(self, objectId, x, y):
-        _param(objectId, [str], "objectId", "moveto")
-        _param(x, [float, int], "x", "moveto")
-        _param(y, [float, int], "y", "moveto")
+        _param(objectId, _STRING, "objectId", "moveto")
+        _param(x, _NUMBER, "x", "moveto")
+        _param(y, _NUMBER, "y", "moveto")
         if objectId not in self.__elems: return
-        self.__elems[objectId].moveto(x, y)
+        self.__elems[objectId].move_to(x, y)
+        self.__stale.add(objectId)
+        self.__dirty = True
 
     def move_to(self, objectId, x, y):
-        _param(objectId, [str], "objectId", "move_to")
-        _param(x, [float, int], "x", "move_to")
-        _param(y, [float, int], "y", "move_to")
+        _param(objectId, _STRING, "objectId", "move_to")
+        _param(x, _NUMBER, "x", "move_to")
+        _param(y, _NUMBER, "y", "move_to")
         self.moveto(objectId, x, y)
 
     def delete(self, objectId):
-        _param(objectId, [str], "objectId", "delete")
+        _param(objectId, _STRING, "objectId", "delete")
         if objectId not in self.__elems: return
         del self.__elems[objectId]
+        self.__file(objectId)
+        self.__dirty = True
+        self.__visible = None
 
     def set_hidden(self, objectId, hidden):
-        _param(objectId, [str], "objectId", "set_hidden")
-        _param(hidden, [bool], "hidden", "set_hidden")
+        _param(objectId, _STRING, "objectId", "set_hidden")
+        _param(hidden, _BOOL, "hidden", "set_hidden")
         if objectId not in self.__elems: return
-        self.__elems[objectId].set_hidden(hidden)
+        self.__elems[objectId].hidden = hidden
+        self.__dirty = True
+        self.__visible = None
 
     def change_text(self, objectId, text):
-        _param(objectId, [str], "objectId", "change_text")
-        _param(text, [str], "text", "change_text")
+        _param(objectId, _STRING, "objectId", "change_text")
+        _param(text, _STRING, "text", "change_text")
         if objectId not in self.__elems: return
         elem = self.__elems[objectId]
         if not isinstance(elem, _Text): return
         elem.text = text
+        self.__dirty = True
 
     def get_mouse_x(self) -> float:
         _unsupported("get_mouse_x")
@@ -420,60 +513,85 @@ class Canvas:
         _unsupported("get_last_key_press")
 
     def find_overlapping(self, x1, y1, x2, y2):
-        _param(x1, [float, int], "x1", "find_overlapping")
-        _param(y1, [float, int], "y1", "find_overlapping")
-        _param(x2, [float, int], "x2", "find_overlapping")
-        _param(y2, [float, int], "y2", "find_overlapping")
-        overlaps = []
-        for tag, elem in self.__elems.items():
-            if elem.overlaps(x1, y1, x2, y2):
-                overlaps.append(tag)
-        return overlaps
+        _param(x1, _NUMBER, "x1", "find_overlapping")
+        _param(y1, _NUMBER, "y1", "find_overlapping")
+        _param(x2, _NUMBER, "x2", "find_overlapping")
+        _param(y2, _NUMBER, "y2", "find_overlapping")
+        elems = self.__elems
+
+        for tag in self.__stale:
+            self.__file(tag)
+        self.__stale.clear()
+
+        # Only visit the grid when the query covers fewer cells than there are shapes.
+        # The cells come from the normalized query, since the overlap tests accept reversed corners
+        i0, i1 = min(x1, x2) // _GRID_CELL, max(x1, x2) // _GRID_CELL
+        j0, j1 = min(y1, y2) // _GRID_CELL, max(y1, y2) // _GRID_CELL
+        if not (i1 - i0 + 1) * (j1 - j0 + 1) <= len(elems):
+            return [tag for tag, elem in elems.items() if elem.overlaps(x1, y1, x2, y2)]
+
+        grid = self.__grid
+        candidates = set(self.__large)
+        for i in range(int(i0), int(i1) + 1):
+            for j in range(int(j0), int(j1) + 1):
+                bucket = grid.get((i, j))
+                if bucket: candidates |= bucket
+
+        # Report shapes in creation order, like a full scan would
+        return [tag for tag in sorted(candidates, key=_creation_order) if elems[tag].overlaps(x1, y1, x2, y2)]
     
     def clear(self):
         self.__elems.clear()
+        self.__grid.clear()
+        self.__cells.clear()
+        self.__large.clear()
+        self.__stale.clear()
+        self.__dirty = True
+        self.__visible = None
 
     def get_left_x(self, objectId) -> float:
-        _param(objectId, [str], "objectId", "get_left_x")
+        _param(objectId, _STRING, "objectId", "get_left_x")
         if objectId not in self.__elems: return None
         return self.__elems[objectId].get_left_x()
     
     def get_top_y(self, objectId) -> float:
-        _param(objectId, [str], "objectId", "get_top_y")
+        _param(objectId, _STRING, "objectId", "get_top_y")
         if objectId not in self.__elems: return None
         return self.__elems[objectId].get_top_y()
     
     def get_x(self, objectId) -> float:
-        _param(objectId, [str], "objectId", "get_x")
+        _param(objectId, _STRING, "objectId", "get_x")
         if objectId not in self.__elems: return None
         return self.__elems[objectId].get_x()
     
     def get_y(self, objectId) -> float:
-        _param(objectId, [str], "objectId", "get_y")
+        _param(objectId, _STRING, "objectId", "get_y")
         if objectId not in self.__elems: return None
         return self.__elems[objectId].get_y()
     
     def get_object_width(self, objectId) -> float:
-        _param(objectId, [str], "objectId", "get_object_width")
+        _param(objectId, _STRING, "objectId", "get_object_width")
         if objectId not in self.__elems: return None
         return self.__elems[objectId].width
     
     def get_object_height(self, objectId) -> float:
-        _param(objectId, [str], "objectId", "get_object_height")
+        _param(objectId, _STRING, "objectId", "get_object_height")
         if objectId not in self.__elems: return None
         return self.__elems[objectId].height
 
     def set_color(self, objectId, color):
-        _param(objectId, [str], "objectId", "set_color")
-        _param(color, [str], "color", "set_color")
+        _param(objectId, _STRING, "objectId", "set_color")
+        _param(color, _STRING, "color", "set_color")
         if objectId not in self.__elems: return
         self.__elems[objectId].fill = color
+        self.__dirty = True
 
     def set_outline_color(self, objectId, color):
-        _param(objectId, [str], "objectId", "set_outline_color")
-        _param(color, [str], "color", "set_outline_color")
+        _param(objectId, _STRING, "objectId", "set_outline_color")
+        _param(color, _STRING, "color", "set_outline_color")
         if objectId not in self.__elems: return
         self.__elems[objectId].outline = color
+        self.__dirty = True
 
     def wait_for_click(self):
         _unsupported("wait_for_click")
@@ -485,11 +603,52 @@ class Canvas:
         _unsupported("get_new_key_presses")
 
     def coords(self, objectId):
-        _param(objectId, [str], "objectId", "coords")
+        _param(objectId, _STRING, "objectId", "coords")
         return [self.get_x(objectId), self.get_y(objectId)]
         
     def _create(self, shape: _Shape) -> str:
         id = f"shape_{Canvas.__next_id}"
         Canvas.__next_id += 1
         self.__elems[id] = shape
+        self.__stale.add(id)
+        self.__dirty = True
+        self.__visible = None
         return id
+
+    def __file(self, tag: str):
+        """Files a shape under the grid cells its bounds touch, replacing where it was filed before"""
+        grid = self.__grid
+        for cell in self.__cells.pop(tag, ()):
+            bucket = grid[cell]
+            bucket.discard(tag)
+            if not bucket: del grid[cell]
+        self.__large.discard(tag)
+
+        elem = self.__elems.get(tag)
+        bounds = elem and elem.bounds()
+        if bounds is None: return
+
+        xmin, ymin, xmax, ymax = bounds
+        i0, i1, j0, j1 = xmin // _GRID_CELL, xmax // _GRID_CELL, ymin // _GRID_CELL, ymax // _GRID_CELL
+        if not (i1 - i0 + 1) * (j1 - j0 + 1) <= _GRID_MAX_CELLS:
+            self.__large.add(tag)
+            return
+
+        cells = [(i, j) for i in range(int(i0), int(i1) + 1) for j in range(int(j0), int(j1) + 1)]
+        for cell in cells:
+            grid.setdefault(cell, set()).add(tag)
+        self.__cells[tag] = cells
+
+
+def _creation_order(tag: str) -> int:
+    return int(tag[6:])
+
+
+# Canvases are kept alive until exit so that one created inside a function still gets drawn
+_canvases: list[Canvas] = []
+
+
+@atexit.register
+def _update_canvases():
+    for canvas in _canvases:
+        canvas.update()
@@ -36,5 +36,6 @@ from stanfordkarel.stanfordkarel import (
     put_beeper,
     right_is_blocked,
     right_is_clear,
+    set_animation,
     turn_left,
 )
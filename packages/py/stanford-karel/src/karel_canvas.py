@@ -15,11 +15,11 @@ Date of Creation: 10/1/2019
 
 from __future__ import annotations
 
-import cmath
 import math
-from typing import TYPE_CHECKING
+from operator import itemgetter
+from typing import TYPE_CHECKING, Iterable
 
-from context2d import Context2D
+from context2d import Context2D, _Recording
 
 from .karel_world import Direction, KarelWorld, Wall
 
@@ -32,6 +32,7 @@ DIRECTION_TO_RADIANS = {
     Direction.WEST: math.pi,
     Direction.NORTH: 3 * math.pi / 2,
 }
+_INV_SQRT2 = 1 / math.sqrt(2)
 
 # Karel Application + World Editor
 DEFAULT_ICON = "karel"
@@ -82,6 +83,14 @@ class KarelCanvas(Context2D):
         self.karel = karel
         self.icon = DEFAULT_ICON
 
+        # Lines waiting to be stroked together as one path, as flat (x1, y1, x2, y2) runs
+        self._line_batch: list[float] = []
+        self._line_batch_width: float = 1
+
+        # Events that drew the world, and the world version they drew
+        self._world_layer: _Recording | None = None
+        self._world_layer_version = -1
+
         self.init_geometry_values()
         self.draw()
 
@@ -92,12 +101,11 @@ class KarelCanvas(Context2D):
         """
         Rotation logic derived from http://effbot.org/zone/tkinter-complex-canvas.htm
         """
-        cangle = cmath.exp(direction * 1j)
-        ccenter = complex(center[0], center[1])
+        cos, sin = math.cos(direction), math.sin(direction)
+        cx, cy = center
         for i in range(0, len(points), 2):
-            x, y = points[i], points[i + 1]
-            v = cangle * (complex(x, y) - ccenter) + ccenter
-            points[i], points[i + 1] = v.real, v.imag
+            x, y = points[i] - cx, points[i + 1] - cy
+            points[i], points[i + 1] = cos * x - sin * y + cx, sin * x + cos * y + cy
 
     def create_default_polygon(
         self,
@@ -105,14 +113,13 @@ class KarelCanvas(Context2D):
         fill: str = "black",
         outline: bool = True
     ) -> None:
-        if len(points) < 4 or len(points) % 2 != 0:
+        n = len(points)
+        if n < 4 or n & 1:
             raise ValueError("Points must contain an even number of coordinates and at least one segment.")
 
+        if self._line_batch: self.flush_lines()
         self.begin_path()
-        self.move_to(points[0], points[1])
-        for i in range(2, len(points), 2):
-            self.line_to(points[i], points[i + 1])
-        self.close_path()
+        self.polyline(zip(points[::2], points[1::2]), close=True)
 
         if fill:
             self.fill_style = fill
@@ -122,18 +129,37 @@ class KarelCanvas(Context2D):
             self.stroke()
 
     def create_line(self, x1: float, y1: float, x2: float, y2: float, width: float=1):
+        self.queue_lines((x1, y1, x2, y2), width)
+
+    def queue_lines(self, lines: Iterable[float], width: float = 1):
+        """
+        Queues lines given as flat (x1, y1, x2, y2) runs. Lines are only drawn once something
+        else is, or the width changes, so that runs of lines cost a single stroke
+        """
+        if width != self._line_batch_width:
+            if self._line_batch: self.flush_lines()
+            self._line_batch_width = width
+        self._line_batch += lines
+
+    def flush_lines(self):
+        """Strokes all lines created since the last flush"""
+        lines = self._line_batch
         self.begin_path()
-        self.move_to(x1, y1)
-        self.line_to(x2, y2)
-        self.line_width = width
+        for i in range(0, len(lines), 4):
+            self.move_to(lines[i], lines[i + 1])
+            self.line_to(lines[i + 2], lines[i + 3])
+        self.line_width = self._line_batch_width
         self.stroke()
+        lines.clear()
 
     def create_text(self, x: float, y: float, text: str, fill: str = "black", font: str = ""):
+        if self._line_batch: self.flush_lines()
         if fill: self.fill_style = fill
         if font: self.font = font
         self.fill_text(text, x, y)
 
     def create_rectangle(self, x1: float, y1: float, x2: float, y2: float, fill: str = "", outline: bool = True):
+        if self._line_batch: self.flush_lines()
         self.begin_path()
         self.rect(x1, y1, x2 - x1, y2 - y1)
         if fill:
@@ -148,8 +174,24 @@ class KarelCanvas(Context2D):
         self.text_align = "center"
         self.text_baseline = "middle"
 
-        self.draw_world()
+        # Each frame has to draw the whole world again, but most actions only move Karel,
+        # so the world is replayed from the last frame unless it changed since
+        layer = self._world_layer
+        if layer is None or self._world_layer_version != self.world.version or not self._replay(layer):
+            layer = None
+            self._begin_recording()
+            try:
+                self.draw_world()
+                if self._line_batch: self.flush_lines()
+                layer = self._end_recording()
+            finally:
+                # A world that failed to draw must not leave the shared recording open
+                if layer is None: self._abort_recording()
+            self._world_layer = layer
+            self._world_layer_version = self.world.version
+
         self.draw_karel()
+        if self._line_batch: self.flush_lines()
         self.commit()
 
     def draw_world(self) -> None:
@@ -181,6 +223,23 @@ class KarelCanvas(Context2D):
         self.right_x = self.left_x + self.boundary_width
         self.bottom_y = self.top_y + self.boundary_height
 
+        # Karel's polygons for each icon and direction, which depend on the cell size
+        self._karel_templates: dict[
+            tuple[str, Direction], list[tuple[list[float], str, bool]]
+        ] = {}
+
+        # Corner centers are looked up from these while drawing, rather than recomputed.
+        # One extra entry on each side covers the corners just outside the world
+        self._half_cell = self.cell_size / 2
+        self._corner_x = [
+            self.left_x + self.cell_size / 2 + (avenue - 1) * self.cell_size
+            for avenue in range(self.world.num_avenues + 2)
+        ]
+        self._corner_y = [
+            self.top_y + self.cell_size / 2 + (self.world.num_streets - street) * self.cell_size
+            for street in range(self.world.num_streets + 2)
+        ]
+
     def draw_bounding_rectangle(self) -> None:
         # Draw the external bounding lines of Karel's world
         self.create_line(
@@ -210,138 +269,161 @@ class KarelCanvas(Context2D):
             self.create_text(label_x, label_y, text=str(street), font="10px Arial")
 
     def draw_corners(self) -> None:
-        # Draw all corner markers in the world
+        # Draw all corner markers in the world. Crosses on uncolored corners are queued and
+        # stroked together at the end, and runs of corners with the same color share a fill
+        crosses: list[float] = []
+        run_color = ""
         for avenue in range(1, self.world.num_avenues + 1):
+            corner_x = self._corner_x[avenue]
             for street in range(1, self.world.num_streets + 1):
                 color = self.world.corner_color(avenue, street)
-                corner_x = self.calculate_corner_x(avenue)
-                corner_y = self.calculate_corner_y(street)
+                corner_y = self._corner_y[street]
                 if not color:
-                    self.create_line(
+                    crosses += (
                         corner_x,
                         corner_y - CORNER_SIZE,
                         corner_x,
                         corner_y + CORNER_SIZE,
-                    )
-                    self.create_line(
                         corner_x - CORNER_SIZE,
                         corner_y,
                         corner_x + CORNER_SIZE,
                         corner_y,
                     )
-                else:
-                    self.create_rectangle(
-                        corner_x - self.cell_size / 2,
-                        corner_y - self.cell_size / 2,
-                        corner_x + self.cell_size / 2,
-                        corner_y + self.cell_size / 2,
-                        fill=color,
-                        outline=False,
-                    )
+                    continue
+
+                if color != run_color:
+                    if run_color:
+                        self.fill()
+                    elif self._line_batch:
+                        self.flush_lines()
+                    self.begin_path()
+                    self.fill_style = color
+                    run_color = color
+                x1 = corner_x - self._half_cell
+                y1 = corner_y - self._half_cell
+                self.rect(
+                    x1,
+                    y1,
+                    corner_x + self._half_cell - x1,
+                    corner_y + self._half_cell - y1,
+                )
+
+        if run_color:
+            self.fill()
+        self.queue_lines(crosses, 1)
 
     def draw_all_beepers(self) -> None:
-        for location, count in self.world.beepers.items():
-            self.draw_beeper(location, count)
-
-    def draw_beeper(self, location: tuple[int, int], count: int) -> None:
-        # handle case where defaultdict returns 0 count by not drawing beepers
-        if count == 0:
+        # Beepers never overlap, so they are filled and outlined as a single path,
+        # with the counts written on top afterwards
+        beepers = self.world.beepers.items()
+        if not beepers:
             return
 
+        if self._line_batch: self.flush_lines()
+        self.begin_path()
+        for location, _ in beepers:
+            self.trace_beeper(location)
+        self.fill_style = "lightgray"
+        self.fill()
+        self.stroke()
+
+        for location, count in beepers:
+            if count > 1:
+                self.create_text(
+                    self.calculate_corner_x(location[0]),
+                    self.calculate_corner_y(location[1]),
+                    text=str(count),
+                    font="12px Arial",
+                    fill="black",
+                )
+
+    def trace_beeper(self, location: tuple[int, int]) -> None:
+        # Adds the outline of a beeper to the current path
         corner_x = self.calculate_corner_x(location[0])
         corner_y = self.calculate_corner_y(location[1])
         beeper_radius = self.cell_size * BEEPER_CELL_SIZE_FRAC
 
-        points = [
-            corner_x,
-            corner_y - beeper_radius,
-            corner_x + beeper_radius,
-            corner_y,
-            corner_x,
-            corner_y + beeper_radius,
-            corner_x - beeper_radius,
-            corner_y,
-        ]
-        self.create_default_polygon(points, fill="lightgray")
-
-        if count > 1:
-            self.create_text(
-                corner_x, corner_y, text=str(count), font="12px Arial", fill="black"
-            )
+        self.move_to(corner_x, corner_y - beeper_radius)
+        self.line_to(corner_x + beeper_radius, corner_y)
+        self.line_to(corner_x, corner_y + beeper_radius)
+        self.line_to(corner_x - beeper_radius, corner_y)
+        self.close_path()
 
     def draw_all_walls(self) -> None:
-        for wall in self.world.walls:
-            self.draw_wall(wall)
+        # A wall north of one corner is the same segment as the wall south of the corner
+        # above it, so shared segments are only stroked once
+        segments = dict.fromkeys(map(self.wall_segment, self.world.walls))
+        for segment in segments:
+            self.queue_lines(segment, LINE_WIDTH)
 
-    def draw_wall(self, wall: Wall) -> None:
+    def wall_segment(self, wall: Wall) -> tuple[int, int, int, int]:
+        """
+        Returns the (x1, y1, x2, y2) segment of a wall with its endpoints in sorted order,
+        rounded to the pixels the canvas draws on so that both sides of a wall compare equal
+        """
         avenue, street, direction = wall.avenue, wall.street, wall.direction
         corner_x = self.calculate_corner_x(avenue)
         corner_y = self.calculate_corner_y(street)
+        half = self._half_cell
+        x1, y1 = round(corner_x - half), round(corner_y - half)
+        x2, y2 = round(corner_x + half), round(corner_y + half)
 
         if direction == Direction.NORTH:
-            self.create_line(
-                corner_x - self.cell_size / 2,
-                corner_y - self.cell_size / 2,
-                corner_x + self.cell_size / 2,
-                corner_y - self.cell_size / 2,
-                width=LINE_WIDTH,
-            )
+            return (x1, y1, x2, y1)
         if direction == Direction.SOUTH:
-            self.create_line(
-                corner_x - self.cell_size / 2,
-                corner_y + self.cell_size / 2,
-                corner_x + self.cell_size / 2,
-                corner_y + self.cell_size / 2,
-                width=LINE_WIDTH,
-            )
+            return (x1, y2, x2, y2)
         if direction == Direction.EAST:
-            self.create_line(
-                corner_x + self.cell_size / 2,
-                corner_y - self.cell_size / 2,
-                corner_x + self.cell_size / 2,
-                corner_y + self.cell_size / 2,
-                width=LINE_WIDTH,
-            )
-        if direction == Direction.WEST:
-            self.create_line(
-                corner_x - self.cell_size / 2,
-                corner_y - self.cell_size / 2,
-                corner_x - self.cell_size / 2,
-                corner_y + self.cell_size / 2,
-                width=LINE_WIDTH,
-            )
+            return (x2, y1, x2, y2)
+        return (x1, y1, x1, y2)
 
     def draw_karel(self) -> None:
         corner_x = self.calculate_corner_x(self.karel.avenue)
         corner_y = self.calculate_corner_y(self.karel.street)
-        center = (corner_x, corner_y)
 
-        if self.icon == "karel":
+        # Karel looks the same on every corner, so its polygons are built and rotated once
+        # around a corner at the origin, then moved onto the corner Karel is on
+        key = (self.icon, self.karel.direction)
+        polygons = self._karel_templates.get(key)
+        if polygons is None:
+            polygons = self._karel_templates[key] = self.build_karel_template(*key)
+
+        for points, fill, outline in polygons:
+            points = [
+                coordinate + (corner_y if i % 2 else corner_x)
+                for i, coordinate in enumerate(points)
+            ]
+            self.create_default_polygon(points, fill=fill, outline=outline)
+
+    def build_karel_template(
+        self, icon: str, direction: Direction
+    ) -> list[tuple[list[float], str, bool]]:
+        center = (0, 0)
+        radians = DIRECTION_TO_RADIANS[direction]
+        if icon == "karel":
             karel_origin_x = (
-                corner_x
                 - self.cell_size / 2
                 + KAREL_LEFT_HORIZONTAL_PAD * self.cell_size
             )
             karel_origin_y = (
-                corner_y - self.cell_size / 2 + KAREL_VERTICAL_OFFSET * self.cell_size
+                - self.cell_size / 2 + KAREL_VERTICAL_OFFSET * self.cell_size
             )
 
-            self.draw_karel_body(
+            return self.karel_body_polygons(
                 karel_origin_x,
                 karel_origin_y,
                 center,
-                DIRECTION_TO_RADIANS[self.karel.direction],
-            )
-            self.draw_karel_legs(
+                radians,
+            ) + self.karel_leg_polygons(
                 karel_origin_x,
                 karel_origin_y,
                 center,
-                DIRECTION_TO_RADIANS[self.karel.direction],
+                radians,
             )
-        elif self.icon == "simple":
-            self.draw_simple_karel_icon(
-                center, DIRECTION_TO_RADIANS[self.karel.direction]
+        if icon == "simple":
+            return self.simple_karel_polygons(
+                center, radians
             )
+        return []
 
     def generate_external_karel_points(
         self, x: float, y: float, center: tuple[float, float], direction: float
@@ -354,8 +436,8 @@ class KarelCanvas(Context2D):
         # Calculate Karel's height and width as well as missing diag segments
         width = self.cell_size * KAREL_WIDTH
         height = self.cell_size * KAREL_HEIGHT
-        lower_left_missing = (self.cell_size * KAREL_LOWER_LEFT_DIAG) / math.sqrt(2)
-        upper_right_missing = (self.cell_size * KAREL_UPPER_RIGHT_DIAG) / math.sqrt(2)
+        lower_left_missing = (self.cell_size * KAREL_LOWER_LEFT_DIAG) * _INV_SQRT2
+        upper_right_missing = (self.cell_size * KAREL_UPPER_RIGHT_DIAG) * _INV_SQRT2
 
         # These two points define Karel's upper right
         outer_points += [x + width - upper_right_missing, y]
@@ -402,9 +484,9 @@ class KarelCanvas(Context2D):
 
         return inner_points
 
-    def draw_karel_body(
+    def karel_body_polygons(
         self, x: float, y: float, center: tuple[float, float], direction: float
-    ) -> None:
+    ) -> list[tuple[list[float], str, bool]]:
         outer_points = self.generate_external_karel_points(x, y, center, direction)
         inner_points = self.generate_internal_karel_points(x, y, center, direction)
 
@@ -413,11 +495,12 @@ class KarelCanvas(Context2D):
         entire_body_points = outer_points + inner_points
 
         # First draw the filled non-convex polygon
-        self.create_default_polygon(entire_body_points, fill="white", outline=False)
-
         # Then draw the transparent exterior edges of Karel's body
-        self.create_default_polygon(outer_points, fill="")
-        self.create_default_polygon(inner_points, fill="")
+        polygons = [
+            (entire_body_points, "white", False),
+            (outer_points, "", True),
+            (inner_points, "", True),
+        ]
 
         # Define dimensions and location of Karel's mouth
         # karel_height = self.cell_size * KAREL_HEIGHT
@@ -437,11 +520,12 @@ class KarelCanvas(Context2D):
             mouth_y,
         ]
         self.rotate_points(center, mouth_points, direction)
-        self.create_default_polygon(mouth_points, fill="white")
+        polygons.append((mouth_points, "white", True))
+        return polygons
 
-    def draw_karel_legs(
+    def karel_leg_polygons(
         self, x: float, y: float, center: tuple[float, float], direction: float
-    ) -> None:
+    ) -> list[tuple[list[float], str, bool]]:
         leg_length = self.cell_size * KAREL_LEG_LENGTH
         foot_length = self.cell_size * KAREL_FOOT_LENGTH
         leg_foot_width = self.cell_size * KAREL_LEG_FOOT_WIDTH
@@ -463,7 +547,7 @@ class KarelCanvas(Context2D):
         points += [x, y + vertical_offset]
 
         self.rotate_points(center, points, direction)
-        self.create_default_polygon(points, outline=False)
+        left_leg = points
 
         # Reset point of reference to be bottom left rather than top_left
         y += self.cell_size * KAREL_HEIGHT
@@ -482,11 +566,11 @@ class KarelCanvas(Context2D):
         points += [x + horizontal_offset, y]
 
         self.rotate_points(center, points, direction)
-        self.create_default_polygon(points, outline=False)
+        return [(left_leg, "black", False), (points, "black", False)]
 
-    def draw_simple_karel_icon(
+    def simple_karel_polygons(
         self, center: tuple[float, float], direction: float
-    ) -> None:
+    ) -> list[tuple[list[float], str, bool]]:
         simple_karel_width = self.cell_size * SIMPLE_KAREL_WIDTH
         simple_karel_height = self.cell_size * SIMPLE_KAREL_HEIGHT
         center_x, center_y = center
@@ -507,12 +591,16 @@ class KarelCanvas(Context2D):
             center_y - simple_karel_height / 2,
         ]
         self.rotate_points(center, points, direction)
-        self.create_default_polygon(points, fill="background")
+        return [(points, "background", True)]
 
     def calculate_corner_x(self, avenue: float) -> float:
+        if avenue.__class__ is int and 0 <= avenue < len(self._corner_x):
+            return self._corner_x[avenue]
         return self.left_x + self.cell_size / 2 + (avenue - 1) * self.cell_size
 
     def calculate_corner_y(self, street: float) -> float:
+        if street.__class__ is int and 0 <= street < len(self._corner_y):
+            return self._corner_y[street]
         return (
             self.top_y
             + self.cell_size / 2
@@ -539,18 +627,21 @@ class KarelCanvas(Context2D):
         corner_y = self.calculate_corner_y(street)
         wall_proximity = self.cell_size * WALL_DETECTION_THRESHOLD
 
-        if x > (corner_x + self.cell_size / 2 - wall_proximity):
-            # Check for a wall to the east
-            return Wall(avenue, street, Direction.EAST)
-        if x < (corner_x - self.cell_size / 2 + wall_proximity):
-            # Check for a wall to the west
-            return Wall(avenue, street, Direction.WEST)
-        if y > (corner_y + self.cell_size / 2 - wall_proximity):
-            # Check for a wall to the south
-            return Wall(avenue, street, Direction.SOUTH)
-        if y < (corner_y - self.cell_size / 2 + wall_proximity):
-            # Check for a wall to the north
-            return Wall(avenue, street, Direction.NORTH)
+        # Distance from the point to each edge of the cell, in order of precedence on ties.
+        # The closest edge wins, so a point near a corner of the cell picks the nearer wall
+        dx = x - corner_x
+        dy = y - corner_y
+        distance, direction = min(
+            (
+                (self._half_cell - dx, Direction.EAST),
+                (self._half_cell + dx, Direction.WEST),
+                (self._half_cell - dy, Direction.SOUTH),
+                (self._half_cell + dy, Direction.NORTH),
+            ),
+            key=itemgetter(0),
+        )
+        if distance < wall_proximity:
+            return Wall(avenue, street, direction)
 
         # No wall within threshold distance
         return None
@@ -43,6 +43,7 @@ from __future__ import annotations
 
 from collections import defaultdict
 import copy
+import itertools
 import re
 import sys
 from enum import Enum, unique
@@ -77,8 +78,12 @@ VALID_WORLD_KEYWORDS = [
 ]
 KEYWORD_DELIM = ":"
 PARAM_DELIM = ";"
+LOCATION_PATTERN = re.compile(r"\((\d+),\s*(\d+)\)")
 DEFAULT_WORLD_FILE = "default_world.w"
 
+# Shared by all worlds, so that a version is never reused, even by a reloaded world
+_versions = itertools.count()
+
 
 class KarelWorld:
     def __init__(self, world_file: str) -> None:
@@ -89,7 +94,8 @@ class KarelWorld:
         """
         self.world_file = self.process_world(world_file)
 
-        # Map of beeper locations to the count of beepers at that location
+        # Map of beeper locations to the count of beepers at that location.
+        # Corners without beepers are left out, so the map only holds beepers to draw
         self.beepers: dict[tuple[int, int], int] = defaultdict(int)
 
         # Map of corner colors, defaults to ""
@@ -110,12 +116,16 @@ class KarelWorld:
         # Initial speed slider setting
         self.init_speed = INIT_SPEED
 
+        # Changes whenever the beepers, corner colors or walls of the world do
+        self.version = next(_versions)
+
         # If a world file has been specified, load world details from the file
         if self.world_file:
             self.load_from_file()
 
         # Save initial beeper state to enable world reset
         self.init_beepers = copy.deepcopy(self.beepers)
+        self.version = next(_versions)
 
     def __eq__(self, other: object) -> bool:
         if isinstance(other, KarelWorld):
@@ -190,7 +200,7 @@ class KarelWorld:
             param = param_with_spaces.strip()
 
             # check to see if parameter encodes a location
-            coordinate = re.match(r"\((\d+),\s*(\d+)\)", param)
+            coordinate = LOCATION_PATTERN.match(param)
             if coordinate:
                 # avenue, street
                 params["location"] = int(coordinate.group(1)), int(coordinate.group(2))
@@ -266,6 +276,8 @@ class KarelWorld:
                         self.beepers[params["location"]] += params["val"]
                     else:
                         self.beepers[params["location"]] = params["val"]
+                    if not self.beepers[params["location"]]:
+                        del self.beepers[params["location"]]
 
                 elif keyword == "karel":
                     # Give Karel initial state values
@@ -298,22 +310,35 @@ class KarelWorld:
 
     def add_beeper(self, avenue: int, street: int) -> None:
         self.beepers[(avenue, street)] += 1
+        self.version = next(_versions)
 
     def remove_beeper(self, avenue: int, street: int) -> None:
-        if self.beepers[(avenue, street)] > 0:
-            self.beepers[(avenue, street)] -= 1
+        count = self.beepers.get((avenue, street), 0)
+        if count > 1:
+            self.beepers[(avenue, street)] = count - 1
+        elif count == 1:
+            del self.beepers[(avenue, street)]
+        else:
+            return
+        self.version = next(_versions)
 
     def add_wall(self, wall: Wall) -> None:
         alt_wall = self.get_alt_wall(wall)
         if wall not in self.walls and alt_wall not in self.walls:
             self.walls.add(wall)
+            self.version = next(_versions)
 
     def remove_wall(self, wall: Wall) -> None:
         alt_wall = self.get_alt_wall(wall)
-        self.walls.discard(wall)
-        self.walls.discard(alt_wall)
+        if wall in self.walls or alt_wall in self.walls:
+            self.walls.discard(wall)
+            self.walls.discard(alt_wall)
+            self.version = next(_versions)
 
     def paint_corner(self, avenue: int, street: int, color: str) -> None:
+        # Repainting a corner the color it already shows leaves the drawn world unchanged
+        if color != self.corner_color(avenue, street):
+            self.version = next(_versions)
         self.corner_colors[(avenue, street)] = color
 
     def corner_color(self, avenue: int, street: int) -> str:
@@ -322,7 +347,9 @@ class KarelWorld:
         return ""
 
     def reset_corner(self, avenue: int, street: int) -> None:
-        self.beepers[(avenue, street)] = 0
+        had_beepers = self.beepers.pop((avenue, street), None) is not None
+        if had_beepers or self.corner_color(avenue, street):
+            self.version = next(_versions)
         self.corner_colors[(avenue, street)] = ""
 
     def wall_exists(self, avenue: int, street: int, direction: Direction) -> bool:
@@ -336,6 +363,7 @@ class KarelWorld:
         """Reset initial state of beepers in the world"""
         self.beepers = copy.deepcopy(self.init_beepers)
         self.corner_colors = {}
+        self.version = next(_versions)
 
     def reload_world(self, filename: str | None = None) -> None:
         """Reloads world using constructor."""
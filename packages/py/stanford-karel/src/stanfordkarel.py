@@ -15,6 +15,8 @@ Date of Creation: 10/1/2019
 
 from typing import Callable, Optional
 
+import atexit
+from functools import wraps
 import os
 import sys
 from pathlib import Path
@@ -44,13 +46,13 @@ def __get_world_file() -> str:
     return world_file
 
 def __get_world_file() -> str:
-    def try_find(path: Path) -> Optional[str]:
+    def try_find(path: Optional[Path]) -> Optional[str]:
         if path is None: return None
-        return path.as_posix() if path.is_file() else None
+        return path.as_posix() if os.path.isfile(path) else None
 
     def try_find_any(dir: Path) -> Optional[str]:
         for file in dir.glob("*.w"):
-            if file.is_file():
+            if os.path.isfile(file):
                 return file.as_posix()
         return None
 
@@ -80,46 +82,105 @@ __karel = KarelProgram(__get_world_file())
 __canvas = KarelCanvas(600, 400, world=__karel.world, karel=__karel)
 
 
+__animation_enabled = True
+__needs_redraw = False
+
+
+def set_animation(enabled: bool) -> None:
+    """
+    Turns drawing after every action on or off. Without animation, or at a speed of 100,
+    the world is only drawn once the program exits
+    """
+    global __animation_enabled
+    __animation_enabled = enabled
+
+
+@atexit.register
+def __draw_final_frame() -> None:
+    if __needs_redraw:
+        __canvas.draw()
+
+
+# The speed is read from the environment once, and the delay is only recomputed when
+# the world's speed changes
+__speed_override = float(os.environ["KAREL_SPEED"]) if "KAREL_SPEED" in os.environ else None
+__speed: Optional[float] = None
+__delay = 0.0
+
+
+def __after_action() -> None:
+    global __needs_redraw, __speed, __delay
+    # delay by specified amount
+    # TODO: This should be replaced by time.sleep once the environment supports it
+    speed = __karel.world.init_speed if __speed_override is None else __speed_override
+    if speed != __speed:
+        __speed = speed
+        __delay = 1 - speed / 100
+    if not __animation_enabled or __delay <= 0:
+        # Nobody would see the intermediate frames, so only the last one is drawn
+        __needs_redraw = True
+        return
+    # redraw canvas with updated state of the world
+    __canvas.draw()
+    __needs_redraw = False
+    time.sleep(__delay)
+
+
 def karel_action_decorator(
     karel_fn: Callable[..., None]
 ) -> Callable[..., None]:
+    @wraps(karel_fn)
     def wrapper(*args, **kwargs) -> None:
         # execute Karel function
         karel_fn(*args, **kwargs)
-        # redraw canvas with updated state of the world
-        __canvas.draw()
-        # delay by specified amount
-        # TODO: This should be replaced by time.sleep once the environment supports it
-        if "KAREL_SPEED" in os.environ:
-            speed = float(os.environ["KAREL_SPEED"])
-        else:
-            speed = __karel.world.init_speed
-        time.sleep(1 - speed / 100)
+        __after_action()
+
+    return wrapper
+
+
+# The built-in actions take either no arguments or a color, so each gets a wrapper with a
+# fixed signature rather than packing *args and **kwargs on every call
+def karel_action_decorator_0(karel_fn: Callable[[], None]) -> Callable[[], None]:
+    @wraps(karel_fn)
+    def wrapper() -> None:
+        # execute Karel function
+        karel_fn()
+        __after_action()
+
+    return wrapper
+
+
+def karel_action_decorator_1(karel_fn: Callable[[str], None]) -> Callable[[str], None]:
+    @wraps(karel_fn)
+    def wrapper(color: str) -> None:
+        # execute Karel function
+        karel_fn(color)
+        __after_action()
 
     return wrapper
 
 
-@karel_action_decorator
+@karel_action_decorator_0
 def move() -> None:
     return __karel.move()
 
 
-@karel_action_decorator
+@karel_action_decorator_0
 def turn_left() -> None:
     return __karel.turn_left()
 
 
-@karel_action_decorator
+@karel_action_decorator_0
 def put_beeper() -> None:
     return __karel.put_beeper()
 
 
-@karel_action_decorator
+@karel_action_decorator_0
 def pick_beeper() -> None:
     return __karel.pick_beeper()
 
 
-@karel_action_decorator
+@karel_action_decorator_1
 def paint_corner(color: str) -> None:
     return __karel.paint_corner(color)
 
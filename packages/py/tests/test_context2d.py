@@ -0,0 +1,388 @@
+"""
+Tests for the context2d package. Context2D writes to /dev/canvas, so these run wherever that
+file can be opened, either inside the runtime or on a host where it is a plain file.
+
+python -m unittest discover -s packages/py/tests
+"""
+
+import os
+import struct
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from context2d import Context2D  # noqa: E402
+
+
+def written_events(since: int) -> list[tuple[int, int, bytes]]:
+    """Flushes and returns the (type, id, payload) of each event written to /dev/canvas after `since`"""
+    Context2D.flush()
+    with open("/dev/canvas", "rb") as f:
+        f.seek(since)
+        data = f.read()
+    events, offset = [], 0
+    while offset < len(data):
+        length, event_type, context_id = struct.unpack_from(">IBB", data, offset)
+        events.append((event_type, context_id, data[offset + 6:offset + 4 + length]))
+        offset += 4 + length
+    return events
+
+
+def canvas_size() -> int:
+    Context2D.flush()
+    return os.path.getsize("/dev/canvas")
+
+
+def f32(value: float) -> bytes:
+    return struct.pack(">f", value)
+
+
+class FlushTests(unittest.TestCase):
+    def test_partial_writes_are_resumed(self):
+        ctx = Context2D()
+        ctx.fill_rect(1, 2, 3, 4)
+        start = canvas_size()
+        ctx.fill_rect(5, 6, 7, 8)
+        write = os.write
+        with mock.patch("os.write", lambda fd, data: write(fd, bytes(data[:3]))):
+            Context2D.flush()
+        events = [(event_type, data) for event_type, _, data in written_events(start)]
+        self.assertEqual(events, [(6, struct.pack(">hhhh", 5, 6, 7, 8))])
+
+    def test_bytes_written_before_an_error_are_not_sent_again(self):
+        ctx = Context2D()
+        ctx.fill_rect(0, 0, 1, 1)
+        start = canvas_size()
+        ctx.fill_rect(1, 2, 3, 4)
+        ctx.fill_rect(5, 6, 7, 8)
+        write, calls = os.write, []
+
+        def failing_write(fd, data):
+            # Half of the first event gets through, then the canvas fails
+            calls.append(len(data))
+            if len(calls) > 1:
+                raise OSError("canvas unavailable")
+            return write(fd, bytes(data[:7]))
+
+        with mock.patch("context2d.os.write", failing_write):
+            with self.assertRaises(OSError):
+                Context2D.flush()
+        # Each event arrives exactly once, with nothing in between
+        events = [(event_type, data) for event_type, _, data in written_events(start)]
+        self.assertEqual(events, [(6, struct.pack(">hhhh", 1, 2, 3, 4)), (6, struct.pack(">hhhh", 5, 6, 7, 8))])
+        self.assertEqual(canvas_size() - start, 2 * 14)
+
+    def test_a_failed_flush_does_not_repeat_recorded_events(self):
+        ctx = Context2D()
+        ctx._begin_recording()
+        start = canvas_size()
+        ctx.fill_rect(1, 2, 3, 4)
+        write = os.write
+        with mock.patch("context2d.os.write", lambda fd, data: write(fd, bytes(data[:7])) if len(data) == 14 else 0):
+            with self.assertRaises(OSError):
+                Context2D.flush()
+        recording = ctx._end_recording()
+        Context2D.flush()
+        with open("/dev/canvas", "rb") as f:
+            f.seek(start)
+            self.assertEqual(bytes(recording._events), f.read())
+
+    def test_a_write_of_nothing_raises(self):
+        ctx = Context2D()
+        start = canvas_size()
+        ctx.fill_rect(1, 2, 3, 4)
+        with mock.patch("os.write", lambda fd, data: 0):
+            with self.assertRaises(OSError):
+                Context2D.flush()
+        # The events are kept, so a later flush still sends them
+        types = [event_type for event_type, _, _ in written_events(start)]
+        self.assertEqual(types, [6])
+
+
+class StateTests(unittest.TestCase):
+    def test_setters_are_held_until_a_draw(self):
+        ctx = Context2D()
+        start = canvas_size()
+        ctx.line_width = 3
+        ctx.line_width = 4
+        ctx.global_alpha = 0.5
+        self.assertEqual(written_events(start), [])
+        ctx.fill_rect(0, 0, 1, 1)
+        events = [(event_type, data) for event_type, _, data in written_events(start)]
+        self.assertEqual(events, [(11, f32(4)), (52, f32(0.5)), (6, struct.pack(">hhhh", 0, 0, 1, 1))])
+
+    def test_path_events_do_not_release_setters(self):
+        ctx = Context2D()
+        start = canvas_size()
+        ctx.line_width = 3
+        ctx.begin_path()
+        ctx.arc(0, 0, 1, 0, 1)
+        ctx.stroke()
+        types = [event_type for event_type, _, _ in written_events(start)]
+        self.assertEqual(types, [32, 38, 11, 44])
+
+    def test_set_and_revert_sends_nothing(self):
+        ctx = Context2D()
+        ctx.line_width = 5
+        ctx.fill_rect(0, 0, 1, 1)
+        start = canvas_size()
+        ctx.line_width = 1
+        ctx.line_width = 5
+        ctx.fill_rect(0, 0, 1, 1)
+        types = [event_type for event_type, _, _ in written_events(start)]
+        self.assertEqual(types, [6])
+
+    def test_resize_forgets_the_sent_state(self):
+        ctx = Context2D()
+        ctx.line_width = 5
+        ctx.fill_rect(0, 0, 1, 1)
+        start = canvas_size()
+        ctx.width = 400
+        ctx.line_width = 1
+        ctx.line_width = 5
+        ctx.fill_rect(0, 0, 1, 1)
+        ctx.height = 200
+        ctx.line_width = 1
+        ctx.line_width = 5
+        ctx.fill_rect(0, 0, 1, 1)
+        events = written_events(start)
+        self.assertEqual([event_type for event_type, _, _ in events], [2, 11, 6, 4, 11, 6])
+        self.assertEqual(events[1][2], f32(5))
+        self.assertEqual(events[4][2], f32(5))
+
+
+def gradient_stops(gradient) -> list[tuple[float, str]]:
+    """Decodes the (offset, color) stops of a packed gradient"""
+    data = gradient._pack()
+    stops, offset = [], 1
+    for _ in range(data[0]):
+        stop, length = struct.unpack_from(">fI", data, offset)
+        offset += 8
+        stops.append((stop, data[offset:offset + length].decode()))
+        offset += length
+    return stops
+
+
+class GradientTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ctx = Context2D()
+
+    def test_stops_are_sorted_by_offset(self):
+        gradient = self.ctx.create_linear_gradient(0, 0, 10, 10)
+        gradient.add_color_stop(1, "blue")
+        gradient.add_color_stop(0, "red")
+        gradient.add_color_stop(0.5, "green")
+        self.assertEqual([color for _, color in gradient_stops(gradient)], ["red", "green", "blue"])
+
+    def test_equal_offsets_keep_the_order_they_were_added(self):
+        gradient = self.ctx.create_linear_gradient(0, 0, 10, 10)
+        # 0.1 is not exact as a float32, so this also checks that offsets are compared after rounding
+        gradient.add_color_stop(0.1, "red")
+        gradient.add_color_stop(0.5, "blue")
+        gradient.add_color_stop(0.1, "green")
+        gradient.add_color_stop(0.1, "white")
+        self.assertEqual([color for _, color in gradient_stops(gradient)], ["red", "green", "white", "blue"])
+
+    def test_stops_are_limited_to_255(self):
+        gradient = self.ctx.create_linear_gradient(0, 0, 10, 10)
+        for i in range(255):
+            gradient.add_color_stop(i / 254, "red")
+        with self.assertRaises(ValueError):
+            gradient.add_color_stop(0.5, "blue")
+        self.assertEqual(len(gradient_stops(gradient)), 255)
+
+    def test_offsets_must_be_between_0_and_1(self):
+        gradient = self.ctx.create_linear_gradient(0, 0, 10, 10)
+        with self.assertRaises(ValueError):
+            gradient.add_color_stop(-0.1, "red")
+        with self.assertRaises(ValueError):
+            gradient.add_color_stop(1.1, "red")
+
+
+class DedupTests(unittest.TestCase):
+    def test_repeated_begin_path_is_sent_once(self):
+        ctx = Context2D()
+        start = canvas_size()
+        ctx.begin_path()
+        ctx.begin_path()
+        ctx.rect(0, 0, 1, 1)
+        ctx.begin_path()
+        types = [event_type for event_type, _, _ in written_events(start)]
+        self.assertEqual(types, [32, 41, 32])
+
+    def test_repeated_set_transform_is_sent_once(self):
+        ctx = Context2D()
+        start = canvas_size()
+        ctx.set_transform(1, 0, 0, 1, 5, 5)
+        ctx.set_transform(1, 0, 0, 1, 5, 5)
+        ctx.set_transform(2, 0, 0, 2, 0, 0)
+        ctx.transform(1, 0, 0, 1, 5, 5)
+        ctx.transform(1, 0, 0, 1, 5, 5)
+        types = [event_type for event_type, _, _ in written_events(start)]
+        self.assertEqual(types, [50, 50, 49, 49])
+
+
+class FillRectsTests(unittest.TestCase):
+    def test_rects_are_sent_as_one_event(self):
+        ctx = Context2D()
+        start = canvas_size()
+        ctx.fill_rects([(1, 2, 3, 4), (5.4, 6.6, 7, 8)])
+        events = [(event_type, data) for event_type, _, data in written_events(start)]
+        self.assertEqual(events, [(61, struct.pack(">H8h", 2, 1, 2, 3, 4, 5, 7, 7, 8))])
+
+    def test_large_batches_are_split(self):
+        ctx = Context2D()
+        start = canvas_size()
+        ctx.fill_rects((i % 100, 0, 1, 1) for i in range(0x10000))
+        counts = [struct.unpack_from(">H", data)[0] for _, _, data in written_events(start)]
+        self.assertEqual(counts, [0xFFFF, 1])
+
+    def test_out_of_range_rects_send_nothing(self):
+        ctx = Context2D()
+        start = canvas_size()
+        rects = [(0, 0, 1, 1)] * 0x10000 + [(40000, 0, 1, 1)]
+        with self.assertRaises(struct.error):
+            ctx.fill_rects(rects)
+        self.assertEqual(written_events(start), [])
+
+
+class PathTests(unittest.TestCase):
+    def test_out_of_range_point_raises_at_the_call(self):
+        ctx = Context2D()
+        ctx.move_to(0, 0)
+        with self.assertRaises(struct.error):
+            ctx.line_to(40000, 0)
+        with self.assertRaises(struct.error):
+            ctx.move_to(0, -40000)
+        with self.assertRaises(struct.error):
+            ctx.polyline([(0, 0), (40000, 0)])
+
+    def test_polyline_points_must_be_pairs(self):
+        ctx = Context2D()
+        with self.assertRaises(ValueError):
+            ctx.polyline([(0, 0), (1, 2, 3)])
+        with self.assertRaises(ValueError):
+            ctx.polyline([(0, 0), (1,)])
+        start = canvas_size()
+        ctx.line_to(10, 0)
+        ctx.stroke()
+        # Nothing from the rejected polylines is left in the path
+        types = [event_type for event_type, _, _ in written_events(start)]
+        self.assertEqual(types, [35, 44])
+
+    def test_context_still_draws_after_an_out_of_range_point(self):
+        ctx = Context2D()
+        ctx.move_to(0, 0)
+        with self.assertRaises(struct.error):
+            ctx.line_to(40000, 0)
+        start = canvas_size()
+        ctx.line_to(10, 0)
+        ctx.stroke()
+        ctx.fill_rect(0, 0, 1, 1)
+        ctx.commit()
+        types = [event_type for event_type, _, _ in written_events(start)]
+        self.assertEqual(types, [60, 44, 6, 3])
+
+
+class RecordingTests(unittest.TestCase):
+    def test_replay_repeats_the_recorded_events(self):
+        ctx = Context2D()
+        ctx.fill_style = "blue"
+        ctx.fill_rect(0, 0, 1, 1)
+        ctx._begin_recording()
+        start = canvas_size()
+        ctx.fill_style = "red"
+        ctx.fill_rect(1, 2, 3, 4)
+        recording = ctx._end_recording()
+        self.assertIsNotNone(recording)
+        recorded = written_events(start)
+
+        # Back to the state the recording started from
+        ctx.fill_style = "blue"
+        ctx.fill_rect(0, 0, 1, 1)
+        start = canvas_size()
+        self.assertTrue(ctx._replay(recording))
+        self.assertEqual(written_events(start), recorded)
+        self.assertEqual(ctx.fill_style, "red")
+
+    def test_replay_is_refused_from_a_different_state(self):
+        ctx = Context2D()
+        ctx._begin_recording()
+        ctx.fill_rect(1, 2, 3, 4)
+        recording = ctx._end_recording()
+
+        ctx.line_width = 5
+        ctx.fill_rect(0, 0, 1, 1)
+        start = canvas_size()
+        self.assertFalse(ctx._replay(recording))
+        self.assertEqual(written_events(start), [])
+
+    def test_replay_is_refused_on_another_context(self):
+        ctx, other = Context2D(), Context2D()
+        ctx._begin_recording()
+        ctx.fill_rect(1, 2, 3, 4)
+        recording = ctx._end_recording()
+        self.assertFalse(other._replay(recording))
+
+    def test_recordings_with_commit_or_remove_are_refused(self):
+        ctx = Context2D()
+        ctx._begin_recording()
+        ctx.fill_rect(1, 2, 3, 4)
+        ctx.commit()
+        self.assertIsNone(ctx._end_recording())
+
+        removed = Context2D()
+        removed._begin_recording()
+        removed.remove()
+        self.assertIsNone(removed._end_recording())
+
+    def test_recordings_with_a_resize_are_refused(self):
+        ctx = Context2D()
+        ctx._begin_recording()
+        ctx.width = 400
+        ctx.fill_rect(1, 2, 3, 4)
+        self.assertIsNone(ctx._end_recording())
+
+        ctx._begin_recording()
+        ctx.height = 400
+        self.assertIsNone(ctx._end_recording())
+
+    def test_recordings_with_another_context_are_refused(self):
+        ctx, other = Context2D(), Context2D()
+        ctx._begin_recording()
+        other.fill_rect(1, 2, 3, 4)
+        self.assertIsNone(ctx._end_recording())
+
+    def test_only_one_recording_at_a_time(self):
+        ctx, other = Context2D(), Context2D()
+        ctx._begin_recording()
+        try:
+            with self.assertRaises(Exception):
+                other._begin_recording()
+            with self.assertRaises(Exception):
+                other._end_recording()
+        finally:
+            ctx._abort_recording()
+
+    def test_abort_recording_allows_a_new_recording(self):
+        ctx = Context2D()
+        ctx._begin_recording()
+        ctx.fill_rect(1, 2, 3, 4)
+        ctx._abort_recording()
+        with self.assertRaises(Exception):
+            ctx._end_recording()
+        ctx._begin_recording()
+        self.assertIsNotNone(ctx._end_recording())
+
+    def test_abort_recording_leaves_other_recordings_alone(self):
+        ctx, other = Context2D(), Context2D()
+        ctx._begin_recording()
+        other._abort_recording()
+        self.assertIsNotNone(ctx._end_recording())
+
+
+if __name__ == "__main__":
+    unittest.main()
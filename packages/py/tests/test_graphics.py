@@ -0,0 +1,240 @@
+"""
+Tests for the stanford-graphics package, which is imported as graphics in the runtime.
+Canvas draws through Context2D, so these run wherever /dev/canvas can be opened.
+
+python -m unittest discover -s packages/py/tests
+"""
+
+import importlib.util
+import os
+import random
+import struct
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+_spec = importlib.util.spec_from_file_location(
+    "graphics", os.path.join(os.path.dirname(__file__), "..", "stanford-graphics", "__init__.py"))
+graphics = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(graphics)
+
+from context2d import Context2D  # noqa: E402
+
+
+def canvas_size() -> int:
+    Context2D.flush()
+    return os.path.getsize("/dev/canvas")
+
+
+def written_types(since: int) -> list[int]:
+    """Flushes and returns the type of each event written to /dev/canvas after `since`"""
+    Context2D.flush()
+    with open("/dev/canvas", "rb") as f:
+        f.seek(since)
+        data = f.read()
+    types, offset = [], 0
+    while offset < len(data):
+        length, event_type = struct.unpack_from(">IB", data, offset)
+        types.append(event_type)
+        offset += 4 + length
+    return types
+
+
+class ParamTests(unittest.TestCase):
+    def test_numbers_are_accepted(self):
+        canvas = graphics.Canvas(100, 100)
+        canvas.create_rectangle(0, 0.5, 10, 10)
+
+    def test_bools_are_not_numbers(self):
+        canvas = graphics.Canvas(100, 100)
+        with self.assertRaises(AssertionError):
+            canvas.create_rectangle(True, 0, 10, 10)
+        shape = canvas.create_rectangle(0, 0, 10, 10)
+        with self.assertRaises(AssertionError):
+            canvas.move(shape, False, 1)
+        canvas.set_hidden(shape, True)
+
+
+
+class FindOverlappingTests(unittest.TestCase):
+    """Checks the grid index against a full scan of independently built shapes"""
+
+    def setUp(self):
+        self.random = random.Random(106)
+        self.canvas = graphics.Canvas(1000, 1000)
+        self.shapes = {}
+
+    def add_random_shape(self, large=False):
+        r = self.random
+        size = 1500 if large else 80
+        x1, y1 = r.uniform(-100, 900), r.uniform(-100, 900)
+        x2, y2 = x1 + r.uniform(-size, size), y1 + r.uniform(-size, size)
+        kind = r.choice(("rectangle", "oval", "line"))
+        if kind == "rectangle":
+            # Rectangle overlap tests expect the first corner to be the top left
+            x1, x2, y1, y2 = min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2)
+            tag, shape = self.canvas.create_rectangle(x1, y1, x2, y2), graphics._Rectangle(x1, y1, x2, y2)
+        elif kind == "oval":
+            x1, x2, y1, y2 = min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2)
+            tag, shape = self.canvas.create_oval(x1, y1, x2, y2), graphics._Oval(x1, y1, x2, y2)
+        else:
+            tag, shape = self.canvas.create_line(x1, y1, x2, y2), graphics._Line(x1, y1, x2, y2)
+        self.shapes[tag] = shape
+        return tag
+
+    def expected(self, x1, y1, x2, y2):
+        return [tag for tag, shape in self.shapes.items() if shape.overlaps(x1, y1, x2, y2)]
+
+    def check(self, x1, y1, x2, y2):
+        self.assertEqual(self.canvas.find_overlapping(x1, y1, x2, y2), self.expected(x1, y1, x2, y2),
+                         f"find_overlapping({x1}, {y1}, {x2}, {y2})")
+
+    def check_random_queries(self, count=300):
+        r = self.random
+        for _ in range(count):
+            x1, y1 = r.uniform(-100, 1000), r.uniform(-100, 1000)
+            x2, y2 = x1 + r.uniform(-150, 150), y1 + r.uniform(-150, 150)
+            self.check(x1, y1, x2, y2)
+            # The same query with both axes reversed
+            self.check(x2, y2, x1, y1)
+
+    def test_matches_a_full_scan(self):
+        for _ in range(200):
+            self.add_random_shape()
+        for _ in range(5):
+            self.add_random_shape(large=True)
+        self.check_random_queries()
+
+    def test_reversed_queries(self):
+        line = self.canvas.create_line(100, 100, 200, 150)
+        self.shapes[line] = graphics._Line(100, 100, 200, 150)
+        for _ in range(50):
+            self.add_random_shape()
+        self.assertIn(line, self.canvas.find_overlapping(210, 160, 90, 90))
+        self.check(210, 160, 90, 90)
+        self.check(90, 160, 210, 90)
+        self.check(210, 90, 90, 160)
+
+    def test_touching_edges(self):
+        for _ in range(50):
+            self.add_random_shape()
+        # Rectangles on grid cell boundaries, queried exactly along their edges
+        for x in (0, 64, 128):
+            tag = self.canvas.create_rectangle(x, 64, x + 64, 128)
+            self.shapes[tag] = graphics._Rectangle(x, 64, x + 64, 128)
+        for x in (0, 63.5, 64, 128, 192):
+            self.check(x, 128, x, 128)
+            self.check(x - 10, 0, x, 64)
+            self.check(x, 128, x + 10, 140)
+
+    def test_large_shapes_are_found_everywhere(self):
+        for _ in range(50):
+            self.add_random_shape()
+        tag = self.canvas.create_rectangle(-500, -500, 2000, 2000)
+        self.shapes[tag] = graphics._Rectangle(-500, -500, 2000, 2000)
+        for x, y in ((0, 0), (999, 999), (-400, 1500)):
+            self.assertIn(tag, self.canvas.find_overlapping(x, y, x + 1, y + 1))
+        self.check_random_queries(100)
+
+    def test_moved_shapes_are_refiled(self):
+        tags = [self.add_random_shape() for _ in range(100)]
+        self.check_random_queries(50)
+        r = self.random
+        for tag in tags[::3]:
+            dx, dy = r.uniform(-300, 300), r.uniform(-300, 300)
+            self.canvas.move(tag, dx, dy)
+            self.shapes[tag].move(dx, dy)
+        for tag in tags[1::3]:
+            x, y = r.uniform(0, 900), r.uniform(0, 900)
+            self.canvas.moveto(tag, x, y)
+            self.shapes[tag].move_to(x, y)
+        self.check_random_queries(100)
+
+    def test_deleted_shapes_are_not_found(self):
+        tags = [self.add_random_shape() for _ in range(100)]
+        self.check_random_queries(50)
+        for tag in tags[::2]:
+            self.canvas.delete(tag)
+            del self.shapes[tag]
+        self.check_random_queries(100)
+
+    def test_clear_forgets_every_shape(self):
+        for _ in range(100):
+            self.add_random_shape()
+        self.check_random_queries(20)
+        self.canvas.clear()
+        self.shapes.clear()
+        self.assertEqual(self.canvas.find_overlapping(-1000, -1000, 2000, 2000), [])
+        for _ in range(100):
+            self.add_random_shape()
+        self.check_random_queries(100)
+
+    def test_results_are_in_creation_order(self):
+        tags = [self.canvas.create_rectangle(i, i, 200, 200) for i in range(100)]
+        # Moving a shape refiles it, but must not change where it is reported
+        self.canvas.move(tags[0], 1, 1)
+        self.assertEqual(self.canvas.find_overlapping(150, 150, 160, 160), tags)
+
+
+
+class UpdateTests(unittest.TestCase):
+    def setUp(self):
+        self.canvas = graphics.Canvas(100, 100)
+        self.rect = self.canvas.create_rectangle(0, 0, 10, 10)
+        self.text = self.canvas.create_text(20, 20, "hello")
+        self.canvas.update()
+
+    def assert_redraws(self, mutate):
+        start = canvas_size()
+        mutate()
+        self.canvas.update()
+        self.assertIn(3, written_types(start), "update did not commit a new frame")
+
+    def test_unchanged_canvas_is_not_redrawn(self):
+        start = canvas_size()
+        self.canvas.update()
+        self.canvas.update()
+        self.assertEqual(written_types(start), [])
+
+    def test_every_mutator_redraws(self):
+        canvas = self.canvas
+        self.assert_redraws(lambda: canvas.create_oval(0, 0, 5, 5))
+        self.assert_redraws(lambda: canvas.move(self.rect, 1, 1))
+        self.assert_redraws(lambda: canvas.moveto(self.rect, 2, 2))
+        self.assert_redraws(lambda: canvas.move_to(self.rect, 3, 3))
+        self.assert_redraws(lambda: canvas.set_color(self.rect, "red"))
+        self.assert_redraws(lambda: canvas.set_outline_color(self.rect, "blue"))
+        self.assert_redraws(lambda: canvas.set_hidden(self.rect, True))
+        self.assert_redraws(lambda: canvas.change_text(self.text, "world"))
+        self.assert_redraws(lambda: canvas.delete(self.text))
+        self.assert_redraws(canvas.clear)
+
+    def test_hidden_and_deleted_shapes_are_not_drawn(self):
+        canvas = self.canvas
+        canvas.delete(self.text)
+        start = canvas_size()
+        canvas.set_hidden(self.rect, True)
+        canvas.update()
+        self.assertNotIn(6, written_types(start))
+
+        start = canvas_size()
+        canvas.set_hidden(self.rect, False)
+        canvas.update()
+        self.assertIn(6, written_types(start))
+
+        start = canvas_size()
+        canvas.delete(self.rect)
+        canvas.update()
+        self.assertNotIn(6, written_types(start))
+
+    def test_missing_shapes_do_not_redraw(self):
+        start = canvas_size()
+        self.canvas.move("shape_missing", 1, 1)
+        self.canvas.set_color("shape_missing", "red")
+        self.canvas.update()
+        self.assertEqual(written_types(start), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -546,6 +546,22 @@ export enum CanvasEventType {
    * After this message is received, no more messages will be sent and the connection may be closed.
    */
   ConnectionClosed = 59,
+
+  /**
+   * Draws a run of straight lines in a single event.
+   * If `move` is set, [moves](https://developer.mozilla.org/en-US/docs/Web/API/CanvasRenderingContext2D/moveTo) to the first point first,
+   * then [draws lines](https://developer.mozilla.org/en-US/docs/Web/API/CanvasRenderingContext2D/lineTo) through the remaining points.
+   *
+   * `[move: bool] [nPoints: uint16] ([x: int16] [y: int16])*`
+   */
+  Polyline = 60,
+
+  /**
+   * [Fills](https://developer.mozilla.org/en-US/docs/Web/API/CanvasRenderingContext2D/fillRect) a run of rectangles in a single event.
+   *
+   * `[nRects: uint16] ([x: int16] [y: int16] [width: int16] [height: int16])*`
+   */
+  FillRects = 61,
 }
 
 export enum GradientType {
@@ -970,6 +986,25 @@ export function unpackCanvasEvent(chunk: ReadableChunk) {
     case CanvasEventType.ConnectionClosed:
       return [type, id] as const;
 
+    case CanvasEventType.Polyline: {
+      const move = chunk.bool();
+      const nPoints = chunk.uint16();
+      const points: number[] = [];
+      for (let i = 0; i < nPoints * 2; i++) {
+        points.push(chunk.int16());
+      }
+      return [type, id, move, points] as const;
+    }
+
+    case CanvasEventType.FillRects: {
+      const nRects = chunk.uint16();
+      const rects: number[] = [];
+      for (let i = 0; i < nRects * 4; i++) {
+        rects.push(chunk.int16());
+      }
+      return [type, id, rects] as const;
+    }
+
     default:
       throw new Error(`Unknown canvas event type: ${type}`);
   }
@@ -1007,6 +1042,14 @@ export function applyEventToContext(ctx: OffscreenCanvasRenderingContext2D, evt:
       break;
     }
 
+    case CanvasEventType.FillRects: {
+      const [_, __, rects] = evt;
+      for (let i = 0; i < rects.length; i += 4) {
+        ctx.fillRect(rects[i], rects[i + 1], rects[i + 2], rects[i + 3]);
+      }
+      break;
+    }
+
     case CanvasEventType.FillText: {
       const [_, __, ...args] = evt;
       ctx.fillText(...args);
@@ -1192,6 +1235,15 @@ export function applyEventToContext(ctx: OffscreenCanvasRenderingContext2D, evt:
       break;
     }
 
+    case CanvasEventType.Polyline: {
+      const [_, __, move, points] = evt;
+      for (let i = 0; i < points.length; i += 2) {
+        if (i === 0 && move) ctx.moveTo(points[i], points[i + 1]);
+        else ctx.lineTo(points[i], points[i + 1]);
+      }
+      break;
+    }
+
     case CanvasEventType.BezierCurveTo: {
       const [_, __, ...args] = evt;
       ctx.bezierCurveTo(...args);